@@ -0,0 +1,253 @@
+"""
+AsyncSDClient
+
+asyncio counterparts of SDClient and SimClient.
+All the connections are served by the event loop they were created from,
+so a single thread can drive many cars.
+
+Handlers are the same IMesgHandler used by the threaded SimClient:
+on_recv_message() is called from the event loop.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Collection, Dict, List, Optional, Tuple, Union
+
+from .codec import JsonCodec, get_codec
+from .framing import FrameBuffer, drop_stale_frames, parse_frame
+from .message import IMesgHandler
+from .util import FloatNotationFixer
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSDClient(asyncio.Protocol):
+    """
+    asyncio version of SDClient.
+    Unlike SDClient, the connection is not opened in the constructor,
+    ``await client.connect()`` must be called from the event loop.
+
+    :param host: address of the sim server
+    :param port: port of the sim server
+    :param codec: json codec used to parse (and encode) messages,
+        see ``gym_donkeycar.core.codec.get_codec()``
+    :param fix_float_notation: whether the sim writes floats with a comma as decimal separator,
+        None to detect it from the messages received.
+    :param latest_only: message types (e.g. "telemetry") of which only the newest frame
+        of each chunk of received bytes is parsed, see ``SDClient``
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        codec: Union[str, JsonCodec] = "auto",
+        fix_float_notation: Optional[bool] = None,
+        latest_only: Collection[str] = (),
+    ):
+        self.codec = get_codec(codec)
+        self.float_fixer = FloatNotationFixer(fix_float_notation)
+        self.host = host
+        self.port = port
+        self.latest_only = frozenset(latest_only)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.transport: Optional[asyncio.Transport] = None
+        self.framer = FrameBuffer()
+        # the aborted flag will be set when the connection was lost
+        # without us asking for it.
+        self.aborted = False
+        self.closing = False
+        # flow control: futures waiting for the transport buffer to drain
+        self.write_paused = False
+        self.drain_waiters: List[asyncio.Future] = []
+
+    async def connect(self) -> None:
+        self.loop = asyncio.get_running_loop()
+
+        logger.info("connecting to %s:%d " % (self.host, self.port))
+        try:
+            await self.loop.create_connection(lambda: self, self.host, self.port)
+        except ConnectionRefusedError:
+            raise (
+                Exception(
+                    "Could not connect to server. Is it running? "
+                    "If you specified 'remote', then you must start it manually."
+                )
+            )
+
+    # ------ asyncio.Protocol interface ----------- #
+
+    def connection_made(self, transport: asyncio.Transport) -> None:  # pytype: disable=signature-mismatch
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self.framer.feed(data)
+        # each json msg is terminated by a \n newline char.
+        frames = self.framer.frames()
+        if self.latest_only:
+            frames = drop_stale_frames(frames, self.latest_only)
+        for frame in frames:
+            self.on_frame_recv(frame)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.transport = None
+        self.resume_writing()
+        if not self.closing:
+            logger.warning("socket connection lost: %s", exc)
+            self.aborted = True
+            self.on_msg_recv({"msg_type": "aborted"})
+
+    def pause_writing(self) -> None:
+        self.write_paused = True
+
+    def resume_writing(self) -> None:
+        self.write_paused = False
+        waiters, self.drain_waiters = self.drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    # ------ SDClient interface ----------- #
+
+    def in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def write(self, data: bytes) -> None:
+        """
+        Write raw bytes, can be called from any thread.
+        """
+        if self.in_loop_thread():
+            if self.transport is not None:
+                self.transport.write(data)
+        elif self.loop is not None:
+            self.loop.call_soon_threadsafe(self.write, data)
+
+    def send_now(self, msg: Union[str, bytes]) -> None:
+        logger.debug("send_now: %r", msg)
+        self.write(msg.encode("utf-8") if isinstance(msg, str) else msg)
+
+    async def send(self, m: Union[str, bytes]) -> None:
+        """
+        Write a message and wait until the transport
+        is ready to accept more data.
+        """
+        logger.debug("sending %r", m)
+        self.write(m.encode("utf-8") if isinstance(m, str) else m)
+        if self.write_paused and self.transport is not None:
+            waiter = self.loop.create_future()
+            self.drain_waiters.append(waiter)
+            await waiter
+
+    def on_frame_recv(self, frame: bytes) -> None:
+        j = parse_frame(frame, self.codec, self.float_fixer)
+        if j is not None:
+            self.on_msg_recv(j)
+
+    def on_msg_recv(self, j: Dict[str, Any]) -> None:
+        logger.debug("got:" + j["msg_type"])
+
+    def stop(self) -> None:
+        self.closing = True
+        if self.transport is None:
+            return
+        if self.in_loop_thread():
+            self.transport.close()
+        else:
+            self.loop.call_soon_threadsafe(self.transport.close)
+
+
+class AsyncSimClient(AsyncSDClient):
+    """
+    asyncio version of SimClient: talks to the sim using json dict messages
+    and gives the messages received to an IMesgHandler.
+
+    :param address: (host, port) of the sim server
+    :param msg_handler: handler of the messages received
+    :param telemetry_queue_size: number of telemetry messages kept for each
+        ``telemetry()`` iterator, older messages are dropped when a consumer is late.
+    :param codec: json codec, see ``gym_donkeycar.core.codec.get_codec()``
+    :param fix_float_notation: comma decimal separator fix, None to detect it
+    :param latest_only: message types of which only the newest frame of each chunk is parsed
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        msg_handler: IMesgHandler,
+        telemetry_queue_size: int = 1,
+        codec: Union[str, JsonCodec] = "auto",
+        fix_float_notation: Optional[bool] = None,
+        latest_only: Collection[str] = (),
+    ):
+        # hold onto the handler
+        self.msg_handler = msg_handler
+        self.telemetry_queue_size = telemetry_queue_size
+        self.telemetry_queues: List[asyncio.Queue] = []
+        super().__init__(*address, codec=codec, fix_float_notation=fix_float_notation, latest_only=latest_only)
+
+    async def connect(self) -> None:
+        await super().connect()
+        self.msg_handler.on_connect(self)
+
+    def send_now(self, msg: Dict[str, Any]) -> None:  # pytype: disable=signature-mismatch
+        # takes a dict input msg, converts to json
+        # and writes it to the transport
+        super().send_now(self.codec.dumps(msg))
+
+    def queue_message(self, msg: Dict[str, Any]) -> None:
+        # writes are already buffered by the transport,
+        # so there is nothing to queue.
+        self.send_now(msg)
+
+    async def send(self, msg: Dict[str, Any]) -> None:  # pytype: disable=signature-mismatch
+        await super().send(self.codec.dumps(msg))
+
+    def on_msg_recv(self, json_obj: Dict[str, Any]) -> None:
+        # pass message on to handler
+        self.msg_handler.on_recv_message(json_obj)
+
+        if json_obj["msg_type"] == "telemetry":
+            for queue in self.telemetry_queues:
+                self._put_latest(queue, json_obj)
+        elif json_obj["msg_type"] == "aborted":
+            for queue in self.telemetry_queues:
+                self._put_latest(queue, None)
+
+    @staticmethod
+    def _put_latest(queue: asyncio.Queue, item: Optional[Dict[str, Any]]) -> None:
+        if queue.full():
+            # drop the oldest message
+            queue.get_nowait()
+        queue.put_nowait(item)
+
+    async def telemetry(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Iterate over the telemetry messages received, until the connection is closed.
+
+        Example: ``async for message in client.telemetry(): ...``
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.telemetry_queue_size)
+        self.telemetry_queues.append(queue)
+        try:
+            while self.transport is not None:
+                message = await queue.get()
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.telemetry_queues.remove(queue)
+
+    def is_connected(self) -> bool:
+        return self.transport is not None and not self.aborted
+
+    async def close(self) -> None:
+        # Called to close client connection
+        self.stop()
+        for queue in self.telemetry_queues:
+            self._put_latest(queue, None)
+
+        if self.msg_handler:
+            self.msg_handler.on_close()
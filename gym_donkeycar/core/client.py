@@ -10,35 +10,103 @@ asynchronous manner.
 Author: Tawn Kramer
 """
 
-import json
 import logging
-import select
 import socket
-import time
-from threading import Thread
-from typing import Any, Dict
+from typing import Any, Collection, Dict, Optional, Union
 
-from .util import replace_float_notation
+from .codec import JsonCodec, get_codec
+from .framing import FrameBuffer, drop_stale_frames, parse_frame
+from .message_queue import OutboundQueue
+from .reactor import SocketReactor
+from .stats import TransportStats
+from .util import FloatNotationFixer
 
 logger = logging.getLogger(__name__)
 
 
 class SDClient:
-    def __init__(self, host: str, port: int, poll_socket_sleep_time: float = 0.001):
-        self.msg = None
+    """
+    :param host: address of the sim server
+    :param port: port of the sim server
+    :param poll_socket_sleep_time: kept for backward compatibility, the message loop
+        now blocks on the socket (and on a wakeup socket pair) instead of polling.
+    :param send_timeout: how long ``send_now()`` waits for the message to be written
+    :param codec: json codec used to parse (and encode) messages,
+        see ``gym_donkeycar.core.codec.get_codec()``
+    :param fix_float_notation: whether the sim writes floats with a comma as decimal separator,
+        None to detect it from the messages received.
+    :param reactor: the reactor serving the connection, shared with other clients
+        (see ``gym_donkeycar.core.reactor.get_shared_reactor()``).
+        By default, the client starts its own reactor thread.
+    :param tcp_nodelay: disable Nagle's algorithm, so small messages (controls)
+        are sent right away instead of being delayed until the previous one is acknowledged.
+    :param rcvbuf_size: size of the socket receive buffer (``SO_RCVBUF``), None to keep the OS default
+    :param sndbuf_size: size of the socket send buffer (``SO_SNDBUF``), None to keep the OS default
+    :param recv_size: maximum number of bytes read by one ``recv`` call
+    :param latest_only: message types (e.g. "telemetry") of which only the newest frame
+        of each batch of received bytes is parsed, the older ones are skipped without being decoded.
+        The bytes already waiting in the socket are read before parsing, so a backlog is skipped at once.
+    """
+
+    # maximum number of recv calls made to read the pending bytes when using latest_only
+    max_drain_reads = 8
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        poll_socket_sleep_time: float = 0.001,
+        send_timeout: float = 5.0,
+        codec: Union[str, JsonCodec] = "auto",
+        fix_float_notation: Optional[bool] = None,
+        reactor: Optional[SocketReactor] = None,
+        tcp_nodelay: bool = True,
+        rcvbuf_size: Optional[int] = None,
+        sndbuf_size: Optional[int] = None,
+        recv_size: int = 1024 * 256,
+        latest_only: Collection[str] = (),
+    ):
+        self.codec = get_codec(codec)
+        self.float_fixer = FloatNotationFixer(fix_float_notation)
+        # messages waiting to be written by the message loop
+        self.outbox = OutboundQueue()
+        self.send_timeout = send_timeout
         self.host = host
         self.port = port
         self.poll_socket_sleep_sec = poll_socket_sleep_time
-        self.th = None
+        self.tcp_nodelay = tcp_nodelay
+        self.rcvbuf_size = rcvbuf_size
+        self.sndbuf_size = sndbuf_size
+        self.recv_size = recv_size
+        self.latest_only = frozenset(latest_only)
+        self.stats = TransportStats()
+
+        # a reactor we create is ours to stop
+        self.own_reactor = reactor is None
+        self.reactor = SocketReactor(name=f"donkey-client-{host}:{port}") if reactor is None else reactor
+        # twice the recv size, see FrameBuffer
+        self.framer = FrameBuffer(max(2 * recv_size, 1024 * 512))
+        # bytes of the current message not yet accepted by the socket, and its ticket
+        self.outbuffer = b""
+        self.out_ticket = 0
 
         # the aborted flag will be set when we have detected a problem with the socket
         # that we can't recover from.
         self.aborted = False
+        self.do_process_msgs = False
         self.s = None
         self.connect()
 
+    @property
+    def th(self):
+        """
+        The thread processing the messages of this client.
+        """
+        return self.reactor.thread
+
     def connect(self) -> None:
         self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_socket_options()
 
         # connecting to the server
         logger.info("connecting to %s:%d " % (self.host, self.port))
@@ -52,104 +120,180 @@ class SDClient:
                 )
             )
 
-        # time.sleep(pause_on_create)
         self.do_process_msgs = True
-        self.th = Thread(target=self.proc_msg, args=(self.s,), daemon=True)
-        self.th.start()
+        self.stats.reset()
+        self.reactor.add(self)
 
-    def send(self, m: str) -> None:
-        self.msg = m
+    def set_socket_options(self) -> None:
+        """
+        Apply the socket options, before connecting:
+        the buffer sizes are used to negotiate the TCP window.
+        """
+        if self.tcp_nodelay:
+            self.s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.rcvbuf_size is not None:
+            self.s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf_size)
+        if self.sndbuf_size is not None:
+            self.s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf_size)
 
-    def send_now(self, msg: str) -> None:
-        logger.debug("send_now:" + msg)
-        self.s.sendall(msg.encode("utf-8"))
+    def send(self, m: Union[str, bytes], coalesce_key: Optional[str] = None) -> int:
+        """
+        Queue a message, it will be written by the message loop.
+
+        :param m: the message (str or utf-8 encoded bytes)
+        :param coalesce_key: messages with the same key that follow each other
+            and are not written yet are replaced by the latest one
+            (used for control messages).
+        :raises queue.Full: when the outbound queue stays full for ``send_timeout``
+            (right away from the message loop thread, which can't wait for itself)
+        :return: the ticket of the message in the outbound queue
+        """
+        if isinstance(m, str):
+            m = m.encode("utf-8")
+        ticket = self.outbox.put(m, coalesce_key, block=not self.reactor.in_loop_thread(), timeout=self.send_timeout)
+        self.wakeup()
+        return ticket
+
+    def wakeup(self) -> None:
+        """
+        Ask the message loop to write the queued messages.
+        """
+        self.reactor.request_write(self)
+
+    def send_now(self, msg: Union[str, bytes]) -> None:
+        """
+        Send a message and wait until it was written to the socket.
+        The message goes through the outbound queue, so it is never
+        sent before the messages queued previously.
+        """
+        logger.debug("send_now: %r", msg)
+        if isinstance(msg, str):
+            msg = msg.encode("utf-8")
+        if not self.do_process_msgs or not self.reactor.is_running():
+            self.s.sendall(msg)
+            self.stats.on_send(len(msg))
+            self.stats.on_frame_sent()
+            return
+
+        ticket = self.send(msg)
+        # the message loop can't wait for itself
+        if not self.reactor.in_loop_thread() and not self.outbox.wait_written(ticket, self.send_timeout):
+            logger.warning("timeout while sending message: %r", msg)
 
     def on_msg_recv(self, j: Dict[str, Any]) -> None:
         logger.debug("got:" + j["msg_type"])
 
     def stop(self) -> None:
-        # signal proc_msg loop to stop, then wait for thread to finish
-        # close socket
+        # stop processing messages of this client (and the reactor thread if it's ours),
+        # then close the socket
+        if not self.do_process_msgs and self.s is None:
+            return
         self.do_process_msgs = False
-        if self.th is not None:
-            self.th.join()
+        if self.s is not None:
+            self.reactor.remove(self)
+        if self.own_reactor:
+            self.reactor.stop()
         if self.s is not None:
             self.s.close()
+            self.s = None
+
+    # ------ Reactor interface ----------- #
 
-    def proc_msg(self, sock: socket.socket) -> None:  # noqa: C901
+    def handle_read(self) -> None:
         """
-        This is the thread message loop to process messages.
-        We will send any message that is queued via the self.msg variable
-        when our socket is in a writable state.
-        And we will read any messages when it's in a readable state and then
-        call self.on_msg_recv with the json object message.
+        Called by the reactor when the socket is readable.
+        We call self.on_msg_recv with the json object of every message read.
         """
-        sock.setblocking(False)
-        inputs = [sock]
-        outputs = [sock]
-        localbuffer = ""
+        try:
+            nbytes = self.recv()
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionAbortedError:
+            logger.warn("socket connection aborted")
+            print("socket connection aborted")
+            self.do_process_msgs = False
+            self.reactor.remove(self)
+            return
+
+        if nbytes == 0:
+            logger.warning("socket connection closed by the server")
+            self.aborted = True
+            self.do_process_msgs = False
+            self.reactor.remove(self)
+            return
+
+        if self.latest_only and nbytes == self.recv_size:
+            self.drain()
+
+        # each json msg is terminated by a \n newline char.
+        frames = self.framer.frames()
+        nframes = len(frames)
+        if self.latest_only:
+            frames = drop_stale_frames(frames, self.latest_only)
+        self.stats.on_frames(nframes, nframes - len(frames))
+        for frame in frames:
+            self.on_frame_recv(frame)
+
+    def recv(self) -> int:
+        nbytes = self.framer.recv_into(self.s, self.recv_size)
+        self.stats.on_recv(nbytes)
+        return nbytes
+
+    def drain(self) -> None:
+        """
+        Read the bytes already waiting in the socket,
+        until a recv call does not fill a whole chunk.
+        """
+        try:
+            for _ in range(self.max_drain_reads):
+                if self.recv() < self.recv_size:
+                    return
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def handle_write(self) -> bool:
+        """
+        Called by the reactor to write the queued messages,
+        each message is written with its own send call.
 
-        while self.do_process_msgs:
-            # without this sleep, I was getting very consistent socket errors
-            # on Windows. Perhaps we don't need this sleep on other platforms.
-            time.sleep(self.poll_socket_sleep_sec)
+        :return: True if a message could not be written entirely,
+            we then need to wait for the socket to be writable.
+        """
+        while True:
+            if not self.outbuffer:
+                pending = self.outbox.get()
+                if pending is None:
+                    return False
+                self.out_ticket, self.outbuffer = pending
+                logger.debug("sending %r", self.outbuffer)
             try:
-                # test our socket for readable, writable states.
-                readable, writable, exceptional = select.select(inputs, outputs, inputs)
-
-                for s in readable:
-                    try:
-                        data = s.recv(1024 * 256)
-                    except ConnectionAbortedError:
-                        logger.warn("socket connection aborted")
-                        print("socket connection aborted")
-                        self.do_process_msgs = False
-                        break
-
-                    # we don't technically need to convert from bytes to string
-                    # for json.loads, but we do need a string in order to do
-                    # the split by \n newline char. This seperates each json msg.
-                    data = data.decode("utf-8")
-
-                    localbuffer += data
-
-                    n0 = localbuffer.find("{")
-                    n1 = localbuffer.rfind("}\n")
-                    if n1 >= 0 and 0 <= n0 < n1:  # there is at least one message :
-                        msgs = localbuffer[n0 : n1 + 1].split("\n")
-                        localbuffer = localbuffer[n1:]
-
-                        for m in msgs:
-                            if len(m) <= 2:
-                                continue
-                            # Replace comma with dots for floats
-                            # useful when using unity in a language different from English
-                            m = replace_float_notation(m)
-                            try:
-                                j = json.loads(m)
-                            except Exception as e:
-                                logger.error("Exception:" + str(e))
-                                logger.error("json: " + m)
-                                continue
-
-                            if "msg_type" not in j:
-                                logger.error("Warning expected msg_type field")
-                                logger.error("json: " + m)
-                                continue
-                            else:
-                                self.on_msg_recv(j)
-
-                for s in writable:
-                    if self.msg is not None:
-                        logger.debug("sending " + self.msg)
-                        s.sendall(self.msg.encode("utf-8"))
-                        self.msg = None
-
-                if len(exceptional) > 0:
-                    logger.error("problems w sockets!")
-
-            except Exception as e:
-                print("Exception:", e)
-                self.aborted = True
-                self.on_msg_recv({"msg_type": "aborted"})
-                break
+                sent = self.s.send(self.outbuffer)
+            except (BlockingIOError, InterruptedError):
+                return True
+            self.stats.on_send(sent)
+            self.outbuffer = self.outbuffer[sent:]
+            if self.outbuffer:
+                return True
+            self.stats.on_frame_sent()
+            self.outbox.mark_written(self.out_ticket)
+
+    def handle_error(self, e: Exception) -> None:
+        """
+        Called by the reactor when reading or writing failed,
+        the client is not served anymore.
+        """
+        print("Exception:", e)
+        self.aborted = True
+        self.do_process_msgs = False
+        self.on_msg_recv({"msg_type": "aborted"})
+
+    def on_frame_recv(self, frame: bytes) -> None:
+        """
+        Parse one json message received from the server
+        and give it to self.on_msg_recv.
+
+        :param frame: the json message, as bytes
+        """
+        j = parse_frame(frame, self.codec, self.float_fixer)
+        if j is not None:
+            self.on_msg_recv(j)
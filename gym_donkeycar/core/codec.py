@@ -0,0 +1,116 @@
+"""
+JsonCodec
+
+Json libraries used to parse the messages received from the sim
+and to encode the messages we send.
+orjson, msgspec and ujson are used when they are installed: they are
+much faster than the standard library on the large telemetry messages.
+"""
+
+import json
+from typing import Any, Dict, Type, Union
+
+JsonData = Union[bytes, str]
+
+
+class JsonCodec:
+    """
+    Standard library codec, always available.
+    Other codecs fall back to it when they can't parse a message
+    (e.g. NaN values that are not valid json).
+    """
+
+    name = "json"
+
+    def loads(self, data: JsonData) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self.orjson = orjson
+
+    def loads(self, data: JsonData) -> Any:
+        try:
+            return self.orjson.loads(data)
+        except self.orjson.JSONDecodeError:
+            return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.orjson.dumps(obj)
+
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+
+        self.msgspec = msgspec
+        self.decoder = msgspec.json.Decoder()
+        self.encoder = msgspec.json.Encoder()
+
+    def loads(self, data: JsonData) -> Any:
+        try:
+            return self.decoder.decode(data)
+        except self.msgspec.DecodeError:
+            return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.encoder.encode(obj)
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+
+        self.ujson = ujson
+
+    def loads(self, data: JsonData) -> Any:
+        try:
+            return self.ujson.loads(data)
+        except ValueError:
+            return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.ujson.dumps(obj).encode("utf-8")
+
+
+CODECS: Dict[str, Type[JsonCodec]] = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+    "ujson": UjsonCodec,
+    "json": JsonCodec,
+}
+
+
+def get_codec(codec: Union[str, JsonCodec] = "auto") -> JsonCodec:
+    """
+    Get a json codec by name.
+
+    :param codec: "auto" (fastest installed library), "orjson", "msgspec", "ujson" or "json".
+        A JsonCodec instance is returned as is.
+    :return: the codec
+    """
+    if isinstance(codec, JsonCodec):
+        return codec
+
+    if codec == "auto":
+        for codec_class in CODECS.values():
+            try:
+                return codec_class()
+            except ImportError:
+                continue
+
+    if codec not in CODECS:
+        raise ValueError(f"Unknown json codec {codec}, available: auto, {', '.join(CODECS)}")
+    return CODECS[codec]()
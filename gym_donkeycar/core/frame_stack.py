@@ -0,0 +1,101 @@
+"""
+FrameStack
+
+Stacks the last observations of an env without copying the previous frames every step.
+"""
+
+import sys
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class FrameStack:
+    """
+    The last ``num_frames`` observations, stacked along a new first axis (oldest first).
+
+    Frames are written one after the other in a buffer of ``capacity`` frames,
+    a stack is a read-only view of the last ``num_frames`` ones: each step copies the new frame only.
+    When the buffer is full, the last frames are moved to its beginning,
+    or to a new buffer if views of the current one are still referenced:
+    a stack is never modified once returned, so it can be kept as is (e.g. in a replay buffer).
+
+    :param num_frames: number of frames in a stack
+    :param frame_shape: shape of a frame
+    :param dtype: type of the frames
+    :param capacity: number of frames in the buffer (default: 16 stacks), the larger,
+        the less often the last frames are moved
+    """
+
+    def __init__(
+        self,
+        num_frames: int,
+        frame_shape: Tuple[int, ...],
+        dtype: np.dtype = np.uint8,
+        capacity: Optional[int] = None,
+    ):
+        if num_frames < 1:
+            raise ValueError(f"num_frames must be at least 1, not {num_frames}")
+        self.num_frames = num_frames
+        self.capacity = capacity if capacity is not None else 16 * num_frames
+        if self.capacity < 2 * num_frames:
+            raise ValueError(f"capacity must be at least 2 * num_frames ({2 * num_frames}), not {self.capacity}")
+        self.buffer = np.zeros((self.capacity,) + tuple(frame_shape), dtype=dtype)
+        # reference count of a buffer only referenced by the frame stack (as in FramePool, measured
+        # rather than assumed: it depends on the interpreter)
+        self.free_refcount = self.refcount(self.buffer)
+        # the previous buffer, reused when no stack of it is referenced anymore
+        self.spare: Optional[np.ndarray] = None
+        # index of the next frame written
+        self.end = num_frames
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return (self.num_frames,) + self.buffer.shape[1:]
+
+    def reset(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Start a new episode: the stack is filled with the first frame.
+        """
+        self.move_last_frames()
+        self.buffer[: self.num_frames] = frame
+        self.end = self.num_frames
+        return self.stack()
+
+    def push(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Add a frame, the oldest one is removed from the stack.
+
+        :return: the new stack
+        """
+        if self.end == self.capacity:
+            self.move_last_frames()
+            self.end = self.num_frames - 1
+        self.buffer[self.end] = frame
+        self.end += 1
+        return self.stack()
+
+    def stack(self) -> np.ndarray:
+        view = self.buffer[self.end - self.num_frames : self.end]
+        view.flags.writeable = False
+        return view
+
+    def move_last_frames(self) -> None:
+        """
+        Move the frames of the current stack but the oldest to the beginning of the buffer.
+        """
+        start = self.end - self.num_frames + 1
+        # no stack returned is still used
+        if self.refcount(self.buffer) <= self.free_refcount:
+            self.buffer[: self.num_frames - 1] = self.buffer[start : self.end]
+            return
+        # the last stack is usually still referenced by the caller, the previous buffer may not be anymore
+        if self.spare is None or self.refcount(self.spare) > self.free_refcount:
+            self.spare = np.empty_like(self.buffer)
+        self.spare[: self.num_frames - 1] = self.buffer[start : self.end]
+        self.buffer, self.spare = self.spare, self.buffer
+
+    @staticmethod
+    def refcount(buffer: np.ndarray) -> int:
+        # always called with an attribute of the frame stack, so the references of the call are the same
+        return sys.getrefcount(buffer)
@@ -0,0 +1,202 @@
+"""
+FrameBuffer
+
+Splits the TCP stream sent by the sim into newline delimited json frames,
+without decoding or re-scanning the bytes already received.
+"""
+
+import logging
+import re
+import socket
+from typing import Any, Collection, Dict, List, Optional
+
+from .codec import JsonCodec
+from .util import FloatNotationFixer
+
+logger = logging.getLogger(__name__)
+
+msg_type_pattern = re.compile(rb'"msg_type"\s*:\s*"([^"]*)"')
+# telemetry of a car that did not hit anything
+no_hit_pattern = re.compile(rb'"hit"\s*:\s*"none"')
+
+
+class FrameBuffer:
+    """
+    Growable receive buffer that extracts newline delimited frames.
+
+    Data is received directly into the buffer (see ``recv_into()``),
+    the newline scan resumes where it stopped the last time, and complete
+    frames are returned as ``bytes``, ready to be given to a json parser.
+
+    :param initial_size: initial capacity of the buffer, in bytes.
+        Using twice the size of a ``recv()`` call means the pending bytes only
+        need to be moved to the front once in a while.
+    """
+
+    def __init__(self, initial_size: int = 1024 * 512):
+        self.buffer = bytearray(initial_size)
+        # start of the first incomplete frame
+        self.start = 0
+        # end of the received data
+        self.end = 0
+        # position up to which we already looked for a newline
+        self.scan = 0
+
+    def __len__(self) -> int:
+        """
+        Number of bytes received that are not part of a complete frame yet.
+        """
+        return self.end - self.start
+
+    def reserve(self, size: int) -> None:
+        """
+        Make sure at least ``size`` bytes are free at the end of the buffer,
+        moving the incomplete frame to the front and growing the buffer if needed.
+
+        :param size: number of bytes we want to write
+        """
+        if len(self.buffer) - self.end >= size:
+            return
+
+        pending = self.end - self.start
+        if self.start > 0:
+            self.buffer[:pending] = self.buffer[self.start : self.end]
+            self.scan -= self.start
+            self.start = 0
+            self.end = pending
+
+        if len(self.buffer) - self.end < size:
+            new_size = max(2 * len(self.buffer), self.end + size)
+            self.buffer.extend(bytes(new_size - len(self.buffer)))
+
+    def recv_into(self, sock: socket.socket, size: int = 1024 * 256) -> int:
+        """
+        Receive up to ``size`` bytes from the socket directly into the buffer.
+
+        :param sock: the socket to read from
+        :param size: maximum number of bytes to read
+        :return: number of bytes received, 0 means the connection was closed
+        """
+        self.reserve(size)
+        with memoryview(self.buffer) as view:
+            nbytes = sock.recv_into(view[self.end : self.end + size], size)
+        self.end += nbytes
+        return nbytes
+
+    def feed(self, data: bytes) -> None:
+        """
+        Append already received bytes to the buffer.
+
+        :param data: bytes read from the stream
+        """
+        size = len(data)
+        self.reserve(size)
+        self.buffer[self.end : self.end + size] = data
+        self.end += size
+
+    def frames(self) -> List[bytes]:
+        """
+        Extract the complete frames received so far.
+        Empty and whitespace only lines are skipped.
+
+        :return: list of frames, without the trailing newline
+        """
+        frames = []
+        buffer = self.buffer
+        newline = buffer.find(b"\n", self.scan, self.end)
+        if newline >= 0:
+            with memoryview(buffer) as view:
+                while newline >= 0:
+                    frame = view[self.start : newline].tobytes().strip()
+                    # ignore empty lines and leftovers like "}"
+                    if len(frame) > 2:
+                        frames.append(frame)
+                    self.start = newline + 1
+                    newline = buffer.find(b"\n", self.start, self.end)
+        self.scan = self.end
+
+        if self.start == self.end:
+            # nothing pending, next data can be written at the beginning
+            self.start = self.end = self.scan = 0
+        return frames
+
+
+def parse_frame(frame: bytes, codec: JsonCodec, float_fixer: FloatNotationFixer) -> Optional[Dict[str, Any]]:
+    """
+    Parse one json message received from the server.
+
+    :param frame: the json message, as bytes
+    :param codec: the json codec used to parse it
+    :param float_fixer: replaces comma with dots for floats when needed,
+        useful when using unity in a language different from English
+    :return: the message, None if it is invalid
+    """
+    if float_fixer.enabled:
+        frame = float_fixer.fix(frame)
+    try:
+        j = codec.loads(frame)
+    except Exception as e:
+        j = None
+        if float_fixer.detecting:
+            j = _parse_fixed_frame(frame, codec, float_fixer)
+        if j is None:
+            logger.error("Exception:" + str(e))
+            logger.error("json: %r", frame)
+            return None
+
+    if "msg_type" not in j:
+        logger.error("Warning expected msg_type field")
+        logger.error("json: %r", frame)
+        return None
+    return j
+
+
+def _parse_fixed_frame(frame: bytes, codec: JsonCodec, float_fixer: FloatNotationFixer) -> Optional[Dict[str, Any]]:
+    fixed_frame = float_fixer.fix(frame)
+    if fixed_frame == frame:
+        return None
+    try:
+        j = codec.loads(fixed_frame)
+    except Exception:
+        return None
+    logger.info("the sim uses comma as decimal separator, fixing float notation of the messages")
+    float_fixer.enabled = True
+    return j
+
+
+def peek_msg_type(frame: bytes) -> Optional[str]:
+    """
+    Find the type of a message without parsing it.
+    The sim writes msg_type first, so usually only the beginning of the frame is searched.
+
+    :param frame: the json message, as bytes
+    :return: the message type, None if not found
+    """
+    match = msg_type_pattern.search(frame, 0, 64) or msg_type_pattern.search(frame)
+    return match.group(1).decode() if match else None
+
+
+def drop_stale_frames(frames: List[bytes], latest_only: Collection[str]) -> List[bytes]:
+    """
+    Keep only the newest frame of each of the given message types,
+    other messages are all kept, in order.
+    Frames reporting a collision (``hit`` other than "none") are never dropped,
+    so the end of an episode is not missed.
+
+    :param frames: frames received in one batch
+    :param latest_only: message types of which only the newest frame is kept (e.g. "telemetry")
+    :return: the frames to parse
+    """
+    if len(frames) < 2:
+        return frames
+    kept = []
+    seen = set()
+    for frame in reversed(frames):
+        msg_type = peek_msg_type(frame)
+        if msg_type in latest_only:
+            if msg_type in seen and (b'"hit"' not in frame or no_hit_pattern.search(frame)):
+                continue
+            seen.add(msg_type)
+        kept.append(frame)
+    kept.reverse()
+    return kept
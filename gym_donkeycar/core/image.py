@@ -0,0 +1,284 @@
+"""
+FramePool, ImagePreprocessor, LazyFrame
+
+Decodes the camera images sent by the sim into preallocated uint8 buffers,
+instead of allocating a new array for every frame,
+optionally cropped, resized and converted to grayscale while decoding.
+LazyFrame keeps an image encoded until it is used as an array.
+"""
+
+import logging
+import math
+import sys
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePreprocessor:
+    """
+    Transformations applied to the camera images when they are decoded.
+    JPEG images are decoded at a reduced scale (DCT scaling) when the output is smaller,
+    and only their luma is decoded for a grayscale output, all in uint8.
+
+    :param input_shape: shape of the camera images (height, width, depth)
+    :param resolution: (height, width) of the output, None to keep the size of the cropped image
+    :param crop: pixels removed from each side of the camera image: (top, bottom, left, right)
+    :param grayscale: output a single channel (luma, as ``PIL.Image.convert("L")``)
+    :param channel_order: "rgb", or "bgr" (e.g. for OpenCV)
+    """
+
+    def __init__(
+        self,
+        input_shape: Sequence[int],
+        resolution: Optional[Tuple[int, int]] = None,
+        crop: Tuple[int, int, int, int] = (0, 0, 0, 0),
+        grayscale: bool = False,
+        channel_order: str = "rgb",
+    ):
+        if channel_order not in ("rgb", "bgr"):
+            raise ValueError(f"channel_order must be 'rgb' or 'bgr', not {channel_order!r}")
+        height, width = input_shape[:2]
+        top, bottom, left, right = crop
+        if width - left - right <= 0 or height - bottom - top <= 0:
+            raise ValueError(f"crop {crop} removes the whole image of shape {tuple(input_shape)}")
+        self.crop = tuple(crop)
+        if resolution is None:
+            resolution = (height - top - bottom, width - left - right)
+        # (width, height) of the output, as PIL sizes
+        self.size = (int(resolution[1]), int(resolution[0]))
+        self.mode = "L" if grayscale else "RGB"
+        self.reverse_channels = channel_order == "bgr" and not grayscale
+        self.output_shape = (self.size[1], self.size[0], 1 if grayscale else 3)
+
+    @classmethod
+    def from_conf(cls, conf: Dict[str, Any], input_shape: Sequence[int]) -> "ImagePreprocessor":
+        """
+        :param conf: the ``preprocess`` section of the env conf,
+            with the keys ``resolution``, ``crop``, ``grayscale`` and ``channel_order`` (all optional)
+        """
+        return cls(
+            input_shape,
+            resolution=conf.get("resolution"),
+            crop=conf.get("crop", (0, 0, 0, 0)),
+            grayscale=conf.get("grayscale", False),
+            channel_order=conf.get("channel_order", "rgb"),
+        )
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        """
+        :param image: an image just opened, not decoded yet
+        :return: the cropped, resized and converted image
+        """
+        width, height = image.size
+        top, bottom, left, right = self.crop
+        crop_width, crop_height = width - left - right, height - top - bottom
+        # smallest scale giving at least the output size, for JPEG images (no-op for the other formats)
+        image.draft(
+            self.mode,
+            (math.ceil(width * self.size[0] / crop_width), math.ceil(height * self.size[1] / crop_height)),
+        )
+        scale_x, scale_y = image.size[0] / width, image.size[1] / height
+        box = (
+            round(left * scale_x),
+            round(top * scale_y),
+            round((width - right) * scale_x),
+            round((height - bottom) * scale_y),
+        )
+        if box != (0, 0) + image.size:
+            image = image.crop(box)
+        if image.mode != self.mode:
+            image = image.convert(self.mode)
+        if image.size != self.size:
+            image = image.resize(self.size, Image.BILINEAR)
+        return image
+
+
+def open_image(data: bytes, preprocess: Optional[ImagePreprocessor] = None) -> Image.Image:
+    """
+    :param data: an encoded image (jpg or png)
+    :param preprocess: applied to the image
+    """
+    image = Image.open(BytesIO(data))
+    if preprocess is not None:
+        image = preprocess.apply(image)
+    return image
+
+
+class FramePool:
+    """
+    Pool of uint8 image buffers of a given shape.
+
+    The arrays returned by ``decode()`` are read-only views of a buffer of the pool.
+    A buffer is only reused once no view of it is referenced anymore,
+    so an observation is never modified under the caller: it can be kept as is
+    (e.g. in a list), a copy is only needed to get a writable array.
+    When all the buffers are in use, a new one is allocated (and pooled, up to ``max_size`` buffers).
+    Images can be decoded from several threads.
+
+    :param shape: shape of the images (height, width, depth)
+    :param max_size: maximum number of buffers kept in the pool
+    :param preprocess: applied to the images when they are decoded,
+        ``shape`` is then the output shape of the preprocessing
+    """
+
+    def __init__(self, shape: Tuple[int, ...], max_size: int = 8, preprocess: Optional[ImagePreprocessor] = None):
+        self.shape = tuple(shape)
+        self.max_size = max_size
+        self.preprocess = preprocess
+        self.reverse_channels = preprocess is not None and preprocess.reverse_channels
+        self.buffers: List[np.ndarray] = []
+        height, width = self.shape[:2]
+        depth = self.shape[2] if len(self.shape) == 3 else 1
+        # decoded images that can be copied into the buffers
+        self.image_size = (width, height)
+        self.image_mode = {1: "L", 3: "RGB", 4: "RGBA"}.get(depth)
+        # reference count of a buffer only referenced by the pool
+        self.free_refcount = 0
+        self.lock = threading.Lock()
+
+    def is_free(self, index: int) -> bool:
+        return sys.getrefcount(self.buffers[index]) <= self.free_refcount
+
+    def acquire(self) -> np.ndarray:
+        """
+        Get a buffer that is not referenced outside of the pool.
+        """
+        with self.lock:
+            for index in range(len(self.buffers)):
+                if self.is_free(index):
+                    return self.buffers[index]
+
+            buffer = np.empty(self.shape, dtype=np.uint8)
+            if len(self.buffers) < self.max_size:
+                self.buffers.append(buffer)
+                self.free_refcount = sys.getrefcount(self.buffers[-1]) - 1
+            return buffer
+
+    def zeros(self) -> np.ndarray:
+        """
+        A black image, used as placeholder before the first frame.
+        """
+        buffer = self.acquire()
+        buffer.fill(0)
+        return self.read_only_view(buffer)
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """
+        Decode an encoded image (jpg or png) into a buffer of the pool.
+        Images that don't have the shape of the pool are returned as a new array.
+
+        :param data: the encoded image
+        :return: read-only array of the image
+        """
+        image = open_image(data, self.preprocess)
+        if image.size != self.image_size or image.mode != self.image_mode:
+            logger.debug(f"image of size {image.size} and mode {image.mode} does not match the pool shape {self.shape}")
+            return np.asarray(image)
+
+        buffer = self.acquire()
+        # Pillow has no API to decode into an existing array (RGB images are stored with 4 bytes per pixel),
+        # the pixels go through one temporary bytes object.
+        pixels = np.frombuffer(image.tobytes(), dtype=np.uint8).reshape(self.shape)
+        if self.reverse_channels:
+            pixels = pixels[..., ::-1]
+        np.copyto(buffer, pixels)
+        return self.read_only_view(buffer)
+
+    @staticmethod
+    def read_only_view(buffer: np.ndarray) -> np.ndarray:
+        view = buffer.view()
+        view.flags.writeable = False
+        return view
+
+
+class LazyFrame:
+    """
+    A camera image kept as sent by the sim (jpg or png bytes, several times smaller than the decoded image),
+    decoded when it is used as an array: ``np.asarray(frame)``, indexing, or any numpy function.
+    Meant to be stored as is, e.g. in a replay buffer or by a recorder: ``data`` are the bytes to save.
+
+    The decoded images of the last ``cache_size`` frames used are kept (read-only arrays),
+    so a frame used several times in a row is decoded once. Pickling a frame only keeps the encoded image.
+
+    :param data: the encoded image
+    :param shape: shape of the decoded image (height, width, depth), known without decoding it
+    :param preprocess: applied to the image when it is decoded (``shape`` is then its output shape)
+    """
+
+    __slots__ = ("data", "shape", "preprocess", "array")
+
+    dtype = np.dtype(np.uint8)
+    # number of decoded images kept, for all the frames
+    cache_size = 8
+    _cache: "OrderedDict[int, LazyFrame]" = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, data: bytes, shape: Tuple[int, ...], preprocess: Optional[ImagePreprocessor] = None):
+        self.data = data
+        self.shape = tuple(shape)
+        self.preprocess = preprocess
+        # the decoded image, while the frame is in the cache
+        self.array: Optional[np.ndarray] = None
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def decode(self) -> np.ndarray:
+        """
+        :return: read-only array of the image
+        """
+        array = self.array
+        if array is not None:
+            with self._cache_lock:
+                if id(self) in self._cache:
+                    self._cache.move_to_end(id(self))
+            return array
+
+        image = open_image(self.data, self.preprocess)
+        array = np.asarray(image)
+        if array.ndim == 2:
+            array = array[..., np.newaxis]
+        if self.preprocess is not None and self.preprocess.reverse_channels:
+            array = np.ascontiguousarray(array[..., ::-1])
+        array = FramePool.read_only_view(array)
+        self.cache(array)
+        return array
+
+    def cache(self, array: np.ndarray) -> None:
+        with self._cache_lock:
+            self.array = array
+            self._cache[id(self)] = self
+            while len(self._cache) > self.cache_size:
+                _, evicted = self._cache.popitem(last=False)
+                evicted.array = None
+
+    def __array__(self, dtype: Optional[np.dtype] = None, copy: Optional[bool] = None) -> np.ndarray:
+        array = self.decode()
+        if dtype is not None and np.dtype(dtype) != array.dtype:
+            return array.astype(dtype)
+        # the cached array is read-only, a copy is needed for a writable one
+        return array.copy() if copy else array
+
+    def __getitem__(self, key: Any) -> Union[np.ndarray, np.integer]:
+        return self.decode()[key]
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getstate__(self) -> Tuple[bytes, Tuple[int, ...], Optional[ImagePreprocessor]]:
+        return self.data, self.shape, self.preprocess
+
+    def __setstate__(self, state: Tuple[bytes, Tuple[int, ...], Optional[ImagePreprocessor]]) -> None:
+        self.data, self.shape, self.preprocess = state
+        self.array = None
+
+    def __repr__(self) -> str:
+        return f"LazyFrame(shape={self.shape}, {len(self.data)} bytes)"
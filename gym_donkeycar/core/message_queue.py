@@ -0,0 +1,133 @@
+"""
+OutboundQueue
+
+Messages waiting to be written to the sim by the SDClient message loop.
+"""
+
+import queue
+import threading
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+
+class OutboundQueue:
+    """
+    Bounded FIFO of outgoing messages, safe to use from several threads.
+
+    Messages are delivered in the order they were queued.
+    A message queued with a ``coalesce_key`` (for instance control messages)
+    replaces the previous message if it has the same key and was not written yet:
+    only the latest command is sent.
+    When the queue is full, the oldest message with a ``coalesce_key`` is dropped
+    (a newer command follows it). The other messages (scene loading, config, reset...)
+    are never dropped: if there is no message to drop, ``put()`` waits for some room.
+
+    Every message gets a ticket number, ``wait_written()`` can be used
+    to block until a given message was written to the socket.
+
+    :param maxsize: maximum number of messages waiting to be written
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.queue: Deque[Tuple[int, Optional[str], bytes]] = deque()
+        self.lock = threading.Lock()
+        self.written_cond = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        # ticket of the last message queued
+        self.last_ticket = 0
+        # ticket of the last message written to the socket
+        self.written_ticket = 0
+        # tickets of the last messages dropped
+        self.dropped_tickets: Deque[int] = deque(maxlen=maxsize)
+
+        # counters
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def put(self, data: bytes, coalesce_key: Optional[str] = None, block: bool = True, timeout: Optional[float] = None) -> int:
+        """
+        Queue a message.
+
+        :param data: the encoded message
+        :param coalesce_key: when not None, the message replaces
+            the last queued message if it has the same key.
+            Such messages are dropped when the queue is full.
+        :param block: wait for some room when the queue is full of messages that can't be dropped
+        :param timeout: max time to wait, None to wait forever
+        :raises queue.Full: when there is still no room (after the timeout, or right away if ``block`` is False)
+        :return: the ticket of the message
+        """
+        with self.lock:
+            if coalesce_key is not None and self.queue and self.queue[-1][1] == coalesce_key:
+                self.last_ticket += 1
+                self.queue[-1] = (self.last_ticket, coalesce_key, data)
+                self.coalesced += 1
+                return self.last_ticket
+
+            if len(self.queue) >= self.maxsize and not self.drop_oldest():
+                if coalesce_key is not None:
+                    # nothing older to drop, the new command is dropped
+                    self.last_ticket += 1
+                    self.drop(self.last_ticket)
+                    return self.last_ticket
+                if not block or not self.not_full.wait_for(lambda: len(self.queue) < self.maxsize, timeout):
+                    raise queue.Full(f"{len(self.queue)} messages waiting to be written")
+            self.last_ticket += 1
+            self.queue.append((self.last_ticket, coalesce_key, data))
+            return self.last_ticket
+
+    def drop_oldest(self) -> bool:
+        """
+        Drop the oldest message that has a ``coalesce_key``, called with the lock held.
+
+        :return: False if there is no such message
+        """
+        for index, (ticket, coalesce_key, _) in enumerate(self.queue):
+            if coalesce_key is not None:
+                del self.queue[index]
+                self.drop(ticket)
+                return True
+        return False
+
+    def drop(self, ticket: int) -> None:
+        self.dropped += 1
+        self.dropped_tickets.append(ticket)
+        self.written_cond.notify_all()
+
+    def get(self) -> Optional[Tuple[int, bytes]]:
+        """
+        Pop the next message to write.
+
+        :return: (ticket, data) or None if the queue is empty
+        """
+        with self.lock:
+            if not self.queue:
+                return None
+            ticket, _, data = self.queue.popleft()
+            self.not_full.notify()
+            return ticket, data
+
+    def mark_written(self, ticket: int) -> None:
+        """
+        Signal that the message with the given ticket was entirely written.
+        """
+        with self.lock:
+            self.sent += 1
+            self.written_ticket = ticket
+            self.written_cond.notify_all()
+
+    def wait_written(self, ticket: int, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the message with the given ticket (or a message queued after it,
+        in case it was coalesced) was written.
+
+        :return: False if the timeout expired or the message was dropped
+        """
+        with self.lock:
+            done = self.written_cond.wait_for(lambda: self.written_ticket >= ticket or ticket in self.dropped_tickets, timeout)
+            return done and ticket not in self.dropped_tickets
@@ -0,0 +1,256 @@
+"""
+SocketReactor
+
+A selectors loop, running in its own thread, that serves one or many
+SDClient connections. By default every SDClient has its own reactor;
+multi-env processes can share a few of them (see ``get_shared_reactor()``)
+to avoid one I/O thread per car.
+"""
+
+import logging
+import selectors
+import socket
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set
+
+if TYPE_CHECKING:
+    from .client import SDClient
+
+logger = logging.getLogger(__name__)
+
+
+class SocketReactor:
+    """
+    Waits for the sockets of its clients to be readable (or writable when they
+    have something to send) and calls their ``handle_read()`` / ``handle_write()``.
+    The loop blocks until there is something to do: other threads wake it up
+    through a socket pair.
+
+    :param name: name of the thread
+    """
+
+    def __init__(self, name: str = "donkey-reactor"):
+        self.name = name
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+
+        self.lock = threading.Lock()
+        # functions to run in the loop thread (registration changes)
+        self.calls: List[Callable[[], None]] = []
+        # clients that have messages to send
+        self.write_requests: Set["SDClient"] = set()
+        # registered clients, and the events we wait for
+        self.clients: Dict["SDClient", int] = {}
+
+        # clients added and not removed yet (some may not be registered yet)
+        self.assigned: Set["SDClient"] = set()
+
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self.assigned)
+
+    def start(self) -> None:
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+            self.thread.start()
+
+    def is_running(self) -> bool:
+        return self.running and self.thread is not None and self.thread.is_alive()
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self.thread
+
+    def wakeup(self) -> None:
+        """
+        Interrupt the blocking select of the loop.
+        """
+        try:
+            self.wakeup_w.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            # the wakeup socket buffer is full, so the loop will wake up anyway
+            pass
+        except OSError:
+            # already closed
+            pass
+
+    def call_soon(self, fn: Callable[[], None]) -> None:
+        """
+        Run a function in the loop thread.
+        """
+        with self.lock:
+            self.calls.append(fn)
+        self.wakeup()
+
+    def add(self, client: "SDClient") -> None:
+        """
+        Start serving a connected client, the reactor is started if needed.
+        """
+        with self.lock:
+            self.assigned.add(client)
+        self.call_soon(lambda: self._register(client))
+        self.start()
+
+    def remove(self, client: "SDClient") -> None:
+        """
+        Stop serving a client. When called from another thread,
+        returns once the loop won't use the client socket anymore.
+        """
+        with self.lock:
+            self.assigned.discard(client)
+
+        if self.in_loop_thread() or not self.is_running():
+            self._unregister(client)
+            return
+
+        done = threading.Event()
+
+        def unregister() -> None:
+            self._unregister(client)
+            done.set()
+
+        self.call_soon(unregister)
+        if not done.wait(timeout=5.0):
+            logger.warning("reactor %s did not answer, could not remove the client", self.name)
+
+    def request_write(self, client: "SDClient") -> None:
+        """
+        Signal that a client has queued a message.
+        """
+        with self.lock:
+            self.write_requests.add(client)
+        if not self.in_loop_thread():
+            self.wakeup()
+
+    def stop(self) -> None:
+        """
+        Stop the loop thread and release its resources.
+        """
+        self.running = False
+        if self.thread is None:
+            self.close()
+        elif not self.in_loop_thread():
+            self.wakeup()
+            self.thread.join()
+
+    def close(self) -> None:
+        self.selector.close()
+        self.wakeup_r.close()
+        self.wakeup_w.close()
+
+    def _register(self, client: "SDClient") -> None:
+        if client in self.clients or not client.do_process_msgs:
+            return
+        try:
+            client.s.setblocking(False)
+            self.selector.register(client.s, selectors.EVENT_READ, client)
+        except (OSError, ValueError) as e:
+            client.handle_error(e)
+            return
+        self.clients[client] = selectors.EVENT_READ
+        # messages may have been queued before the registration
+        with self.lock:
+            self.write_requests.add(client)
+
+    def _unregister(self, client: "SDClient") -> None:
+        if self.clients.pop(client, None) is None:
+            return
+        with self.lock:
+            self.write_requests.discard(client)
+        try:
+            self.selector.unregister(client.s)
+        except (KeyError, ValueError):
+            # the socket was already closed
+            pass
+
+    def _set_events(self, client: "SDClient", events: int) -> None:
+        if self.clients.get(client, events) != events:
+            self.selector.modify(client.s, events, client)
+            self.clients[client] = events
+
+    def _drain_wakeup(self) -> None:
+        try:
+            while self.wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def run(self) -> None:
+        """
+        The loop of the reactor thread.
+        """
+        try:
+            self.loop()
+        finally:
+            logger.debug("reactor %s stopped", self.name)
+            self.close()
+
+    def loop(self) -> None:
+        while self.running:
+            with self.lock:
+                calls, self.calls = self.calls, []
+                write_requests, self.write_requests = self.write_requests, set()
+            for fn in calls:
+                fn()
+
+            # write what is pending, without waiting for the next select
+            # when the socket can take it right away.
+            for client in write_requests:
+                if client in self.clients:
+                    self._flush(client)
+
+            if not self.running:
+                break
+
+            for key, mask in self.selector.select():
+                client = key.data
+                if client is None:
+                    self._drain_wakeup()
+                    continue
+                if client not in self.clients:
+                    continue
+                if mask & selectors.EVENT_READ:
+                    self._call(client, client.handle_read)
+                if mask & selectors.EVENT_WRITE and client in self.clients:
+                    self._flush(client)
+
+    def _flush(self, client: "SDClient") -> None:
+        # only ask for writability when a message could not be written entirely,
+        # otherwise the select would return immediately.
+        write_pending = self._call(client, client.handle_write)
+        if client in self.clients:
+            self._set_events(client, selectors.EVENT_READ | selectors.EVENT_WRITE if write_pending else selectors.EVENT_READ)
+
+    def _call(self, client: "SDClient", fn: Callable[[], Optional[bool]]) -> Optional[bool]:
+        try:
+            return fn()
+        except Exception as e:
+            self._unregister(client)
+            client.handle_error(e)
+            return None
+
+
+# reactors shared by the clients created with io_threads > 0
+shared_reactors: List[SocketReactor] = []
+shared_reactors_lock = threading.Lock()
+
+
+def get_shared_reactor(num_threads: int = 1) -> SocketReactor:
+    """
+    Get one of the reactors shared by all the connections of the process,
+    the one serving the fewest clients.
+
+    :param num_threads: size of the pool of shared reactors
+    :return: a shared reactor
+    """
+    with shared_reactors_lock:
+        while len(shared_reactors) < num_threads:
+            shared_reactors.append(SocketReactor(name=f"donkey-shared-reactor-{len(shared_reactors)}"))
+        return min(shared_reactors[:num_threads], key=len)
@@ -5,12 +5,13 @@ file: sim_client.py
 notes: wraps a tcp socket client with a handler to talk to the unity donkey simulator
 """
 
-import json
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple, Union
 
 from gym_donkeycar.core.message import IMesgHandler
 
 from .client import SDClient
+from .codec import JsonCodec
+from .reactor import SocketReactor
 
 
 class SimClient(SDClient):
@@ -18,7 +19,18 @@ class SimClient(SDClient):
     Handles messages from a single TCP client.
     """
 
-    def __init__(self, address: Tuple[str, int], msg_handler: IMesgHandler):
+    # consecutive messages of these types not sent yet are replaced by the latest one
+    COALESCED_MSG_TYPES = ("control",)
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        msg_handler: IMesgHandler,
+        codec: Union[str, JsonCodec] = "auto",
+        fix_float_notation: Optional[bool] = None,
+        reactor: Optional[SocketReactor] = None,
+        **kwargs: Any,
+    ):
         # we expect an IMesgHandler derived handler
         # assert issubclass(msg_handler, IMesgHandler)
 
@@ -26,22 +38,25 @@ class SimClient(SDClient):
         self.msg_handler = msg_handler
 
         # connect to sim
-        super().__init__(*address)
+        # (kwargs: socket options, see SDClient)
+        super().__init__(*address, codec=codec, fix_float_notation=fix_float_notation, reactor=reactor, **kwargs)
 
         # we connect right away
         msg_handler.on_connect(self)
 
     def send_now(self, msg: Dict[str, Any]) -> None:  # pytype: disable=signature-mismatch
-        # takes a dict input msg, converts to json string
-        # and sends immediately. right now, no queue.
-        json_msg = json.dumps(msg)
+        # takes a dict input msg, converts to json
+        # and waits until it is sent, after the messages already queued.
+        json_msg = self.codec.dumps(msg)
         super().send_now(json_msg)
 
     def queue_message(self, msg: Dict[str, Any]) -> None:
-        # takes a dict input msg, converts to json string
-        # and adds to a lossy queue that sends only the last msg
-        json_msg = json.dumps(msg)
-        self.send(json_msg)
+        # takes a dict input msg, converts to json
+        # and adds it to the outbound queue. Control messages are coalesced
+        # (only the latest is sent), other messages are all sent in order.
+        json_msg = self.codec.dumps(msg)
+        coalesce_key = msg["msg_type"] if msg.get("msg_type") in self.COALESCED_MSG_TYPES else None
+        self.send(json_msg, coalesce_key)
 
     def on_msg_recv(self, json_obj: Dict[str, Any]) -> None:
         # pass message on to handler
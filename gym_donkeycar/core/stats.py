@@ -0,0 +1,142 @@
+"""
+TransportStats, LatencyStats
+
+Counters kept by a client about what goes through its socket,
+and durations of repeated operations (e.g. resets).
+"""
+
+import math
+import time
+from typing import Dict
+
+
+class TransportStats:
+    """
+    Bytes, frames and system calls of one connection.
+    The counters are updated by the message loop, reading them from
+    another thread is fine (the values may just be one message late).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.start_time = time.perf_counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # frames (json messages) received and sent
+        self.frames_in = 0
+        self.frames_out = 0
+        # frames received but not parsed, a newer one of the same type was received at the same time
+        self.frames_dropped = 0
+        self.recv_calls = 0
+        self.send_calls = 0
+
+    def on_recv(self, nbytes: int) -> None:
+        self.recv_calls += 1
+        self.bytes_in += nbytes
+
+    def on_frames(self, nframes: int, ndropped: int = 0) -> None:
+        self.frames_in += nframes
+        self.frames_dropped += ndropped
+
+    def on_send(self, nbytes: int) -> None:
+        self.send_calls += 1
+        self.bytes_out += nbytes
+
+    def on_frame_sent(self) -> None:
+        self.frames_out += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    @property
+    def fps(self) -> float:
+        """
+        Frames received per second, since the creation of the connection or the last ``reset()``.
+        """
+        elapsed = self.elapsed
+        return self.frames_in / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def avg_frame_size(self) -> float:
+        """
+        Average size of the frames received, in bytes.
+        """
+        return self.bytes_in / self.frames_in if self.frames_in > 0 else 0.0
+
+    @property
+    def recv_calls_per_frame(self) -> float:
+        """
+        How many ``recv`` calls are needed to get one frame:
+        large frames need several calls, unless the receive buffer and recv size are large enough.
+        """
+        return self.recv_calls / self.frames_in if self.frames_in > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "frames_dropped": self.frames_dropped,
+            "recv_calls": self.recv_calls,
+            "send_calls": self.send_calls,
+            "fps": self.fps,
+            "avg_frame_size": self.avg_frame_size,
+            "recv_calls_per_frame": self.recv_calls_per_frame,
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"TransportStats(in={self.bytes_in}B/{self.frames_in} frames, out={self.bytes_out}B/{self.frames_out} frames, "
+            f"fps={self.fps:.1f}, avg_frame_size={self.avg_frame_size:.0f}B, "
+            f"recv_calls_per_frame={self.recv_calls_per_frame:.2f})"
+        )
+
+
+class LatencyStats:
+    """
+    Durations of an operation that either completes, or gives up after a timeout.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.count = 0
+        # operations that didn't complete before the timeout (their duration is included)
+        self.timeouts = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.last = 0.0
+
+    def on_sample(self, duration: float, timed_out: bool = False) -> None:
+        self.count += 1
+        self.timeouts += int(timed_out)
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.last = duration
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "timeouts": self.timeouts,
+            "mean": self.mean,
+            "min": self.min if self.count > 0 else 0.0,
+            "max": self.max,
+            "last": self.last,
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"LatencyStats(count={self.count}, timeouts={self.timeouts}, mean={self.mean * 1000:.1f}ms, "
+            f"max={self.max * 1000:.1f}ms, last={self.last * 1000:.1f}ms)"
+        )
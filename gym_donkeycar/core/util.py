@@ -1,23 +1,48 @@
-import re
-
-
-def replace_float_notation(string: str) -> str:
-    """
-    Replace unity float notation for languages like
-    French or German that use comma instead of dot.
-    This convert the json sent by Unity to a valid one.
-    Ex: "test": 1,2, "key": 2 -> "test": 1.2, "key": 2
-
-    :param string: The incorrect json string
-    :return: Valid JSON string
-    """
-    regex_french_notation = r'"[a-zA-Z_]+":(?P<num>[0-9,E-]+),'
-    regex_end = r'"[a-zA-Z_]+":(?P<num>[0-9,E-]+)}'
-
-    for regex in [regex_french_notation, regex_end]:
-        matches = re.finditer(regex, string, re.MULTILINE)
-
-        for match in matches:
-            num = match.group("num").replace(",", ".")
-            string = string.replace(match.group("num"), num)
-    return string
+import re
+from typing import AnyStr, Optional
+
+# a number written with a comma as decimal separator, just after a key:
+# "speed":1,5 or "cte":-2,5E-05, followed by the next key or the end of an object/array
+float_notation_regex = r'(":\s*-?[0-9]+),([0-9]+(?:[eE][-+]?[0-9]+)?)(?=\s*[,}\]])'
+
+float_notation_patterns = {
+    str: (re.compile(float_notation_regex), r"\1.\2"),
+    bytes: (re.compile(float_notation_regex.encode()), rb"\1.\2"),
+}
+
+
+def replace_float_notation(string: AnyStr) -> AnyStr:
+    """
+    Replace unity float notation for languages like
+    French or German that use comma instead of dot.
+    This convert the json sent by Unity to a valid one.
+    Ex: "test": 1,2, "key": 2 -> "test": 1.2, "key": 2
+
+    This is a single pass over the message, that only touches numeric values.
+
+    :param string: The incorrect json string (or bytes)
+    :return: Valid JSON string (or bytes)
+    """
+    pattern, replacement = float_notation_patterns[type(string)]
+    return pattern.sub(replacement, string)
+
+
+class FloatNotationFixer:
+    """
+    Remembers, for one connection, if the sim sends floats with a comma
+    as decimal separator (Unity running in a French or German locale for instance).
+
+    :param enabled: True to always fix the messages, False to never fix them,
+        None to detect it: the first message that can't be parsed but
+        can be once fixed enables the fixer for the rest of the connection.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = enabled
+
+    @property
+    def detecting(self) -> bool:
+        return self.enabled is None
+
+    def fix(self, frame: bytes) -> bytes:
+        return replace_float_notation(frame)
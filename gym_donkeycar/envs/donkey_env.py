@@ -5,13 +5,14 @@ date: 2018-08-31
 """
 
 import logging
-import time
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
 
+from gym_donkeycar.core.frame_stack import FrameStack
+from gym_donkeycar.core.stats import LatencyStats
 from gym_donkeycar.envs.donkey_proc import DonkeyUnityProcess
 from gym_donkeycar.envs.donkey_sim import DonkeyUnitySimContoller
 
@@ -27,9 +28,13 @@ def supply_defaults(conf: Dict[str, Any]) -> None:
         passed to the environment constructor.
     """
     defaults = [
+        # not used anymore: the env connects as soon as the sim listens (at most start_timeout seconds after starting it)
         ("start_delay", 5.0),
+        ("start_timeout", 60.0),
         ("max_cte", 8.0),
         ("frame_skip", 1),
+        # > 1: observations are the last frame_stack frames, stacked along a new first axis (oldest first)
+        ("frame_stack", 1),
         ("cam_resolution", (120, 160, 3)),
         ("log_level", logging.INFO),
         ("host", "localhost"),
@@ -37,6 +42,49 @@ def supply_defaults(conf: Dict[str, Any]) -> None:
         ("steer_limit", 1.0),
         ("throttle_min", 0.0),
         ("throttle_max", 1.0),
+        # json library used to parse and encode messages: auto | orjson | msgspec | ujson | json
+        ("json_codec", "auto"),
+        # True if the sim writes floats with a comma (e.g. French locale), None to detect it
+        ("fix_float_notation", None),
+        # 0: one I/O thread per env, N > 0: envs of the process share N I/O threads
+        ("io_threads", 0),
+        # socket options: disable Nagle's algorithm (lower control latency), buffer sizes (None: OS default),
+        # max size of a recv call
+        ("tcp_nodelay", True),
+        ("socket_rcvbuf", None),
+        ("socket_sndbuf", None),
+        ("recv_size", 1024 * 256),
+        # only parse the newest telemetry of the frames received together (skip the backlog after a long update)
+        ("latest_telemetry_only", False),
+        # max time to wait for the first telemetry with the configured image size, once the car is loaded
+        ("handshake_timeout", 5.0),
+        # max time to wait for a telemetry showing the car back at the start after a reset
+        # (the first reset, before the start position is known, always waits that long)
+        ("reset_timeout", 1.0),
+        # max time to wait for a telemetry in step() and reset(), None to wait forever.
+        # When it expires, SimFailed is raised: the sim is frozen
+        ("observe_timeout", None),
+        # applied to the camera images when they are decoded (the observation space is updated accordingly):
+        # {"resolution": (height, width), "crop": (top, bottom, left, right), "grayscale": bool,
+        #  "channel_order": "rgb" | "bgr"}
+        ("preprocess", None),
+        # "array": observations are uint8 arrays, "lazy": observations are LazyFrame objects (gym_donkeycar.core.image)
+        # holding the encoded image (several times smaller), decoded when used as an array,
+        # e.g. to store them in a replay buffer.
+        # Stacked frames (frame_stack > 1) are always decoded
+        ("observation_mode", "array"),
+        # evaluate the episode over function on every telemetry received since the last step, not only the last one
+        # (all at once in step(), the I/O thread never runs it)
+        ("episode_over_every_frame", False),
+        # threads decoding the camera images, 0 to decode them on the I/O thread.
+        # With 2 threads, both images of a stereo camera are decoded at the same time
+        ("decode_threads", 0),
+        # lidar products added to the info dict: "point_cloud" and/or "occupancy_grid",
+        # the grid accumulates the last lidar_grid_scans scans, it is lidar_grid_size meters wide
+        ("lidar_outputs", ()),
+        ("lidar_grid_scans", 10),
+        ("lidar_grid_size", 20.0),
+        ("lidar_grid_resolution", 0.25),
     ]
 
     for key, val in defaults:
@@ -90,8 +138,8 @@ class DonkeyEnv(gym.Env):
             # the unity sim server will bind to the host ip given
             self.proc.start(conf["exe_path"], host="0.0.0.0", port=conf["port"])
 
-            # wait for simulator to startup and begin listening
-            time.sleep(conf["start_delay"])
+            # wait for simulator to startup and begin listening (a remote sim is not probed: each connection spawns a car)
+            self.proc.wait_ready(conf["start_timeout"], host=conf["host"], port=conf["port"])
 
         # start simulation com
         self.viewer = DonkeyUnitySimContoller(conf=conf)
@@ -106,7 +154,13 @@ class DonkeyEnv(gym.Env):
         )
 
         # camera sensor data
-        self.observation_space = spaces.Box(0, self.VAL_PER_PIXEL, self.viewer.get_sensor_size(), dtype=np.uint8)
+        observation_shape = tuple(self.viewer.get_sensor_size())
+        # Frame Stacking
+        self.frame_stack = None
+        if conf["frame_stack"] > 1:
+            self.frame_stack = FrameStack(conf["frame_stack"], observation_shape)
+            observation_shape = self.frame_stack.shape
+        self.observation_space = spaces.Box(0, self.VAL_PER_PIXEL, observation_shape, dtype=np.uint8)
 
         # Initialize numpy random generator
         self.np_random = np.random.default_rng()
@@ -126,6 +180,21 @@ class DonkeyEnv(gym.Env):
         if hasattr(self, "proc") and self.proc is not None:
             self.proc.quit()
 
+    @property
+    def handshake_timings(self) -> Dict[str, float]:
+        """
+        Time spent in each step of the connection to the sim, in seconds:
+        connect, scene_names, car_loaded, config, first_frame and total.
+        """
+        return self.viewer.handler.handshake_timings
+
+    @property
+    def reset_stats(self) -> LatencyStats:
+        """
+        Time spent waiting for the car to be back at the start in ``reset()``.
+        """
+        return self.viewer.handler.reset_stats
+
     def set_reward_fn(self, reward_fn: Callable) -> None:
         self.viewer.set_reward_fn(reward_fn)
 
@@ -133,9 +202,21 @@ class DonkeyEnv(gym.Env):
         self.viewer.set_episode_over_fn(ep_over_fn)
 
     def step(self, action: np.ndarray) -> Tuple[np.ndarray, float, bool, bool, Dict[str, Any]]:
-        for _ in range(self.frame_skip):
+        # Frame Skipping: the action is repeated for frame_skip frames and their rewards are summed.
+        # Only the images of the last frame (or of the frame ending the episode) are decoded.
+        total_reward = 0.0
+        for i in range(self.frame_skip):
+            last_frame = i == self.frame_skip - 1
+            self.viewer.set_decode_images(last_frame)
             self.viewer.take_action(action)
-            observation, reward, done, info = self.viewer.observe()
+            observation, reward, done, info = self.viewer.observe(decode=last_frame)
+            total_reward += reward
+            if done:
+                break
+        self.viewer.set_decode_images(True)
+        reward = total_reward
+        if self.frame_stack is not None:
+            observation = self.frame_stack.push(observation)
         # Gymnasium step returns (observation, reward, terminated, truncated, info)
         # 'done' from the simulator represents termination (collision, out of bounds)
         # truncated is always False as this env doesn't implement time-based truncation
@@ -156,12 +237,13 @@ class DonkeyEnv(gym.Env):
             self.np_random = np.random.default_rng(seed)
 
         # Activate hand brake, so the car does not move
+        # (messages are queued in order, no need to wait between them)
         self.viewer.handler.send_control(0, 0, 1.0)
-        time.sleep(0.1)
         self.viewer.reset()
         self.viewer.handler.send_control(0, 0, 1.0)
-        time.sleep(0.1)
         observation, reward, done, info = self.viewer.observe()
+        if self.frame_stack is not None:
+            observation = self.frame_stack.reset(observation)
         # Gymnasium reset returns (observation, info)
         return observation, info
 
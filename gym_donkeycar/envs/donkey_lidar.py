@@ -0,0 +1,189 @@
+"""
+file: donkey_lidar.py
+notes: converts the lidar points sent in the telemetry to arrays,
+    point clouds and occupancy grids.
+    Coordinates are in Unity axes: x right, y up, z forward.
+"""
+
+from operator import itemgetter
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# value of the points for which no hit was reported
+NO_HIT = -1.0
+
+_get_rx = itemgetter("rx")
+_get_ry = itemgetter("ry")
+_get_d = itemgetter("d")
+
+
+class LidarDecoder:
+    """
+    Reconstructs the flat array of distances of a lidar scan,
+    ordered by sweep level then by angle, from the points sent by the sim
+    (only the points that hit something are sent).
+    The sizes derived from the lidar config are computed once.
+
+    :param deg_per_sweep_inc: degrees between two samples of a sweep
+    :param num_sweep_levels: number of sweeps
+    :param deg_ang_delta: angle between two sweeps
+    """
+
+    def __init__(self, deg_per_sweep_inc: float = 1.0, num_sweep_levels: int = 1, deg_ang_delta: float = 1.0):
+        self.deg_per_sweep_inc = deg_per_sweep_inc
+        self.num_sweep_levels = num_sweep_levels
+        self.deg_ang_delta = deg_ang_delta
+        self.points_per_sweep = int(360 / deg_per_sweep_inc)
+        self.num_points = round(abs(num_sweep_levels * self.points_per_sweep))
+        # copied for every scan, so the arrays returned are never modified afterwards
+        self.empty_scan = np.full(self.num_points, NO_HIT, dtype=np.float32)
+
+    def matches(self, deg_per_sweep_inc: float, num_sweep_levels: int, deg_ang_delta: float) -> bool:
+        return (deg_per_sweep_inc, num_sweep_levels, deg_ang_delta) == (
+            self.deg_per_sweep_inc,
+            self.num_sweep_levels,
+            self.deg_ang_delta,
+        )
+
+    @staticmethod
+    def points_arrays(lidar_info: List[Dict[str, float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Extract the values of the points sent by the sim
+        (``np.fromiter`` over C level item getters, faster than building tuples).
+
+        :param lidar_info: list of {"rx": angle, "ry": sweep angle, "d": distance}
+        :return: rx, ry and d arrays
+        """
+        count = len(lidar_info)
+        return (
+            np.fromiter(map(_get_rx, lidar_info), dtype=np.float64, count=count),
+            np.fromiter(map(_get_ry, lidar_info), dtype=np.float64, count=count),
+            np.fromiter(map(_get_d, lidar_info), dtype=np.float64, count=count),
+        )
+
+    def indices(self, rx: np.ndarray, ry: np.ndarray) -> np.ndarray:
+        """
+        Index of each point in the scan array.
+        Like Python ``round()``, ``np.rint()`` rounds half to even.
+        """
+        x_index = np.rint(np.abs(rx / self.deg_per_sweep_inc)).astype(np.intp)
+        y_index = np.rint(np.abs(ry / self.deg_ang_delta)).astype(np.intp)
+        return self.points_per_sweep * y_index + x_index
+
+    def decode(self, lidar_info: Optional[List[Dict[str, float]]]) -> np.ndarray:
+        """
+        :param lidar_info: the points of the telemetry message
+        :return: float32 array of the distances, ``NO_HIT`` (-1) where there is no point
+        """
+        if not lidar_info:
+            return self.empty_scan.copy()
+        return self.scan_array(*self.points_arrays(lidar_info))
+
+    def scan_array(self, rx: np.ndarray, ry: np.ndarray, d: np.ndarray) -> np.ndarray:
+        """
+        Same as ``decode()``, from the arrays returned by ``points_arrays()``.
+        """
+        scan = self.empty_scan.copy()
+        if len(d) == 0:
+            return scan
+
+        indices = self.indices(rx, ry)
+        # points outside of the configured scan are ignored
+        valid = indices < self.num_points
+        if not valid.all():
+            indices, d = indices[valid], d[valid]
+        scan[indices] = d
+        return scan
+
+
+class LidarScan(NamedTuple):
+    """
+    The points of one telemetry message and the pose of the car when they were received.
+    """
+
+    rx: np.ndarray
+    ry: np.ndarray
+    d: np.ndarray
+    # x, z position and yaw (in degrees) of the car
+    pose: Tuple[float, float, float]
+
+    def point_cloud(self, deg_ang_down: float = 0.0, offset: Tuple[float, float, float] = (0.0, 0.0, 0.0)) -> np.ndarray:
+        """
+        Position of the points in the car frame.
+        ``rx`` is the angle from the forward direction, clockwise seen from above,
+        and the sweeps go ``deg_ang_down + ry`` degrees below the horizontal plane.
+
+        :param deg_ang_down: angle of the first sweep (lidar config)
+        :param offset: position of the lidar on the car (offset_x, offset_y, offset_z of the lidar config)
+        :return: float32 array of shape (N, 3)
+        """
+        azimuth = np.radians(self.rx)
+        elevation = np.radians(deg_ang_down + self.ry)
+        horizontal = self.d * np.cos(elevation)
+        cloud = np.empty((len(self.d), 3), dtype=np.float32)
+        cloud[:, 0] = horizontal * np.sin(azimuth) + offset[0]
+        cloud[:, 1] = offset[1] - self.d * np.sin(elevation)
+        cloud[:, 2] = horizontal * np.cos(azimuth) + offset[2]
+        return cloud
+
+
+def car_to_world(points: np.ndarray, pose: Tuple[float, float, float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ground plane (x, z) world coordinates of points in the car frame.
+    """
+    x, z, yaw = pose
+    cos_yaw, sin_yaw = np.cos(np.radians(yaw)), np.sin(np.radians(yaw))
+    return (
+        x + points[:, 0] * cos_yaw + points[:, 2] * sin_yaw,
+        z - points[:, 0] * sin_yaw + points[:, 2] * cos_yaw,
+    )
+
+
+def world_to_car(world_x: np.ndarray, world_z: np.ndarray, pose: Tuple[float, float, float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Inverse of ``car_to_world()``: (x, z) coordinates in the car frame.
+    """
+    x, z, yaw = pose
+    cos_yaw, sin_yaw = np.cos(np.radians(yaw)), np.sin(np.radians(yaw))
+    dx, dz = world_x - x, world_z - z
+    return dx * cos_yaw - dz * sin_yaw, dx * sin_yaw + dz * cos_yaw
+
+
+def occupancy_grid(
+    scans: Sequence[LidarScan],
+    pose: Tuple[float, float, float],
+    deg_ang_down: float = 0.0,
+    offset: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+    size: float = 20.0,
+    resolution: float = 0.25,
+    height_range: Optional[Tuple[float, float]] = None,
+) -> np.ndarray:
+    """
+    Occupancy grid around the car, accumulated over several scans:
+    the points of each scan are placed with the pose of the car at that time.
+    The car is at the center of the grid, facing up (towards row 0).
+
+    :param scans: the scans to accumulate
+    :param pose: current x, z position and yaw (in degrees) of the car
+    :param deg_ang_down: angle of the first sweep (lidar config)
+    :param offset: position of the lidar on the car
+    :param size: side of the grid, in meters
+    :param resolution: side of a cell, in meters
+    :param height_range: only count the points with a height (in the car frame) in this range,
+        e.g. to ignore the ground
+    :return: uint8 array of shape (size / resolution, size / resolution),
+        the number of points in each cell (up to 255)
+    """
+    num_cells = int(round(size / resolution))
+    counts = np.zeros(num_cells * num_cells, dtype=np.int64)
+    for scan in scans:
+        cloud = scan.point_cloud(deg_ang_down, offset)
+        if height_range is not None:
+            cloud = cloud[(cloud[:, 1] >= height_range[0]) & (cloud[:, 1] <= height_range[1])]
+        x, z = world_to_car(*car_to_world(cloud, scan.pose), pose)
+        cols = np.floor((x + size / 2) / resolution).astype(np.intp)
+        rows = np.floor((size / 2 - z) / resolution).astype(np.intp)
+        inside = (cols >= 0) & (cols < num_cells) & (rows >= 0) & (rows < num_cells)
+        counts += np.bincount(rows[inside] * num_cells + cols[inside], minlength=num_cells * num_cells)
+    return np.minimum(counts, 255).astype(np.uint8).reshape((num_cells, num_cells))
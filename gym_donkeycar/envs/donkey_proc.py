@@ -4,17 +4,31 @@ author: Felix Yu
 date: 2018-09-12
 """
 
+import logging
 import os
+import socket
 import subprocess
+import time
+from collections import deque
+from typing import Optional
+
+from gym_donkeycar.envs.donkey_ex import SimFailed
+
+logger = logging.getLogger(__name__)
 
 
 class DonkeyUnityProcess:
+    # log file of the sim, relative to the working directory
+    LOG_FILE = "unitylog.txt"
+
     def __init__(self):
         self.proc1 = None
+        self.port = 9091
 
     # ------ Launch Unity Env ----------- #
 
     def start(self, sim_path: str, host: str = "0.0.0.0", port: int = 9091):
+        self.port = port
         if sim_path == "remote":
             return
 
@@ -22,13 +36,69 @@ class DonkeyUnityProcess:
             print(sim_path, "does not exist. you must start sim manually.")
             return
 
-        port_args = ["--port", str(port), "--host", str(host), "-logFile", "unitylog.txt"]
+        port_args = ["--port", str(port), "--host", str(host), "-logFile", self.LOG_FILE]
 
         # Launch Unity environment
         self.proc1 = subprocess.Popen([sim_path] + port_args)
 
         print("donkey subprocess started")
 
+    def wait_ready(
+        self, timeout: float = 60.0, host: str = "localhost", port: Optional[int] = None, max_interval: float = 0.5
+    ) -> float:
+        """
+        Wait until the sim started by ``start()`` accepts connections, trying to connect to its port
+        with an increasing interval between the attempts.
+        Nothing is done if no sim was started (remote sim, or sim started manually):
+        each connection spawns a car in the scene of a running sim, so it is not probed.
+
+        :param timeout: max time to wait, in seconds
+        :param host: address to connect to
+        :param port: port of the sim (default: the one given to ``start()``)
+        :param max_interval: max time between two attempts
+        :return: the time it took, in seconds
+        :raises SimFailed: when the sim process exits, or doesn't listen before the timeout
+        """
+        if self.proc1 is None:
+            return 0.0
+        if port is None:
+            port = self.port
+        start = time.perf_counter()
+        deadline = start + timeout
+        interval = 0.05
+        while True:
+            self.check_running()
+            remaining = deadline - time.perf_counter()
+            try:
+                with socket.create_connection((host, port), timeout=max(min(remaining, 1.0), 0.01)):
+                    pass
+                elapsed = time.perf_counter() - start
+                logger.info(f"sim listening on {host}:{port} after {elapsed:.2f}s")
+                return elapsed
+            except OSError:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise SimFailed(f"the sim is not listening on {host}:{port} after {timeout}s")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+
+    def check_running(self) -> None:
+        """
+        :raises SimFailed: when the sim process has exited
+        """
+        if self.proc1 is None or self.proc1.poll() is None:
+            return
+        log_tail = self.log_tail()
+        raise SimFailed(f"the sim exited with code {self.proc1.returncode}, last lines of {self.LOG_FILE}:\n{log_tail}")
+
+    def log_tail(self, num_lines: int = 20) -> str:
+        try:
+            with open(self.LOG_FILE, errors="replace") as log_file:
+                return "".join(deque(log_file, maxlen=num_lines))
+        except OSError:
+            return "(no log)"
+
     def quit(self) -> None:
         """
         Shutdown unity environment
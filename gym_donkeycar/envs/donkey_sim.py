@@ -4,24 +4,36 @@ author: Tawn Kramer
 date: 2018-08-31
 """
 
+import asyncio
 import base64
 import logging
 import math
 import os
+import threading
 import time
 import types
-from io import BytesIO
-from typing import Any, Callable, Dict, List, Tuple, Union
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
 
 import numpy as np
-from PIL import Image
 
 from gym_donkeycar.core.fps import FPSTimer
+from gym_donkeycar.core.image import FramePool, ImagePreprocessor, LazyFrame, open_image
 from gym_donkeycar.core.message import IMesgHandler
+from gym_donkeycar.core.reactor import get_shared_reactor
 from gym_donkeycar.core.sim_client import SimClient
+from gym_donkeycar.core.stats import LatencyStats
+from gym_donkeycar.envs.donkey_ex import SimFailed
+from gym_donkeycar.envs.donkey_lidar import LidarDecoder, LidarScan, occupancy_grid
+from gym_donkeycar.envs.donkey_telemetry import MESSAGE_KEYS, TelemetryExtractor, TelemetryInfo, TelemetryRecord
 
 logger = logging.getLogger(__name__)
 
+# position of some values in the tuple returned by TelemetryExtractor.values()
+_HIT_INDEX = MESSAGE_KEYS.index("hit")
+_YAW_INDEX = MESSAGE_KEYS.index("yaw")
+
 
 # Math helpers added by CireNeikual (222464)
 def euler_to_quat(e):
@@ -61,6 +73,15 @@ def rotate_vec(q, v):
     return [v[0] + uv[0] + uuv[0], v[1] + uv[1] + uuv[1], v[2] + uv[2] + uuv[2]]
 
 
+def _set_waiter_done(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _decode_image(frame_pool: FramePool, img_string: str) -> np.ndarray:
+    return frame_pool.decode(base64.b64decode(img_string))
+
+
 class DonkeyUnitySimContoller:
     def __init__(self, conf: Dict[str, Any]):
         logger.setLevel(conf["log_level"])
@@ -69,7 +90,22 @@ class DonkeyUnitySimContoller:
 
         self.handler = DonkeyUnitySimHandler(conf=conf)
 
-        self.client = SimClient(self.address, self.handler)
+        # with io_threads > 0, the connections of all the envs of the process
+        # are served by a pool of io_threads shared reactor threads
+        reactor = get_shared_reactor(conf["io_threads"]) if conf["io_threads"] > 0 else None
+
+        self.client = SimClient(
+            self.address,
+            self.handler,
+            codec=conf["json_codec"],
+            fix_float_notation=conf["fix_float_notation"],
+            reactor=reactor,
+            tcp_nodelay=conf["tcp_nodelay"],
+            rcvbuf_size=conf["socket_rcvbuf"],
+            sndbuf_size=conf["socket_sndbuf"],
+            recv_size=conf["recv_size"],
+            latest_only=("telemetry",) if conf["latest_telemetry_only"] else (),
+        )
 
     def set_car_config(
         self,
@@ -90,11 +126,16 @@ class DonkeyUnitySimContoller:
         self.handler.set_episode_over_fn(ep_over_fn)
 
     def wait_until_loaded(self) -> None:
-        time.sleep(0.1)
-        while not self.handler.loaded:
+        """
+        Wait until the car is loaded (signaled by the sim),
+        then until the first telemetry with the configured image size (at most ``handshake_timeout`` seconds).
+        """
+        while not self.handler.loaded_event.wait(1.0):
             logger.warning("waiting for sim to start..")
-            time.sleep(1.0)
+        if not self.handler.ready.wait(self.handler.handshake_timeout):
+            logger.warning(f"no telemetry with an image of size {self.handler.camera_img_size} received yet")
         logger.info("sim started!")
+        logger.info(f"handshake timings: {self.handler.handshake_timings}")
 
     def reset(self) -> None:
         self.handler.reset()
@@ -105,11 +146,15 @@ class DonkeyUnitySimContoller:
     def take_action(self, action: np.ndarray):
         self.handler.take_action(action)
 
-    def observe(self) -> Tuple[np.ndarray, float, bool, Dict[str, Any]]:
-        return self.handler.observe()
+    def observe(self, timeout: Optional[float] = None, decode: bool = True) -> Tuple[np.ndarray, float, bool, Dict[str, Any]]:
+        return self.handler.observe(timeout, decode)
+
+    def set_decode_images(self, decode_images: bool) -> None:
+        self.handler.decode_images = decode_images
 
     def quit(self) -> None:
         self.client.stop()
+        self.handler.on_close()
 
     def exit_scene(self) -> None:
         self.handler.send_exit_scene()
@@ -124,28 +169,116 @@ class DonkeyUnitySimContoller:
         return self.handler.calc_reward(done)
 
 
+def _frame_value(name: str) -> property:
+    return property(lambda self: getattr(self.frame, name), doc=f"``{name}`` of the telemetry frame being observed")
+
+
+def _image_result(frame_pool: FramePool, image: Union[np.ndarray, Future, str, None]) -> Optional[np.ndarray]:
+    # the image of a frame: decoded, being decoded or still encoded
+    if isinstance(image, Future):
+        return image.result()
+    if isinstance(image, str):
+        return _decode_image(frame_pool, image)
+    return image
+
+
 class DonkeyUnitySimHandler(IMesgHandler):
+    # a telemetry after a reset is the car at the start when it is this close to the spawn point
+    # (in meters, on the ground plane),
+    # and this slow (speed reported by the sim)
+    RESET_DISTANCE_TOLERANCE = 1.0
+    RESET_SPEED_TOLERANCE = 0.5
+    # with episode_over_every_frame, max number of frames kept between two observations
+    # (the older ones are not evaluated, e.g. when the env is not stepped for a while)
+    MAX_UNOBSERVED_FRAMES = 64
+
+    # Values of the telemetry frame being observed (read-only).
+    # The I/O thread never modifies them: it publishes a new frame for each telemetry,
+    # observe() then takes the last one, so the observation, the reward
+    # and the episode over functions all see the values of the same message.
+    x = _frame_value("x")
+    y = _frame_value("y")
+    z = _frame_value("z")
+    cte = _frame_value("cte")
+    speed = _frame_value("speed")
+    forward_vel = _frame_value("forward_vel")
+    hit = _frame_value("hit")
+    gyro_x = _frame_value("gyro_x")
+    gyro_y = _frame_value("gyro_y")
+    gyro_z = _frame_value("gyro_z")
+    accel_x = _frame_value("accel_x")
+    accel_y = _frame_value("accel_y")
+    accel_z = _frame_value("accel_z")
+    vel_x = _frame_value("vel_x")
+    vel_y = _frame_value("vel_y")
+    vel_z = _frame_value("vel_z")
+    lidar = _frame_value("lidar")
+    # car in Unity lefthand coordinate system: roll is Z, pitch is X and yaw is Y
+    roll = _frame_value("roll")
+    pitch = _frame_value("pitch")
+    yaw = _frame_value("yaw")
+
     def __init__(self, conf: Dict[str, Any]):
         self.conf = conf
         self.SceneToLoad = conf["level"]
-        self.loaded = False
+        # set when the car is loaded, and when the first telemetry with the configured image size is received
+        self.loaded_event = threading.Event()
+        self.ready = threading.Event()
+        self.handshake_timeout = conf["handshake_timeout"]
+        # time spent in each step of the handshake, in seconds
+        self.handshake_timings: Dict[str, float] = {}
+        self.handshake_start = self.handshake_time = time.perf_counter()
+        # config messages sent on this connection, by msg_type: only the changed ones are sent again.
+        # While send_config() runs, the messages are collected in config_batch and sent together.
+        self.sent_config: Dict[str, Dict[str, Any]] = {}
+        self.config_batch: Optional[List[Dict[str, Any]]] = None
         self.max_cte = conf["max_cte"]
         self.timer = FPSTimer()
 
         # sensor size - height, width, depth
         self.camera_img_size = conf["cam_resolution"]
-        self.image_array = np.zeros(self.camera_img_size)
+        # crop, resize and grayscale conversion applied to both cameras when decoding the images
+        self.preprocess = None
+        self.observation_shape = tuple(self.camera_img_size)
+        if conf["preprocess"]:
+            self.preprocess = ImagePreprocessor.from_conf(conf["preprocess"], self.camera_img_size)
+            self.observation_shape = self.preprocess.output_shape
+        # images are decoded into reused uint8 buffers,
+        # observations are read-only arrays that are never modified once returned
+        self.frame_pool = FramePool(self.observation_shape, preprocess=self.preprocess)
+        self.frame_pool_b = FramePool(self.observation_shape, preprocess=self.preprocess)
+        self.image_array = self.frame_pool.zeros()
         self.image_array_b = None
+        # "lazy": the images are not decoded by the handler, observations are LazyFrame objects holding the encoded images
+        if conf["observation_mode"] not in ("array", "lazy"):
+            raise ValueError(f"observation_mode must be 'array' or 'lazy', not {conf['observation_mode']!r}")
+        self.lazy_frames = conf["observation_mode"] == "lazy"
+        # with decode_threads > 0, the images of a frame are decoded concurrently on a thread pool
+        # and the I/O thread does not wait for them: observe() waits for the decoding of the last frame.
+        self.decode_executor = None
+        if conf["decode_threads"] > 0:
+            self.decode_executor = ThreadPoolExecutor(conf["decode_threads"], thread_name_prefix="donkey-decode")
         self.last_obs = self.image_array
-        self.time_received = time.time()
-        self.last_received = self.time_received
-        self.hit = "none"
-        self.cte = 0.0
-        self.x = 0.0
-        self.y = 0.0
-        self.z = 0.0
-        self.speed = 0.0
-        self.forward_vel = 0.0
+        # False while the env skips frames: the images are kept encoded, and only decoded if observed
+        self.decode_images = True
+        # last frame published by the I/O thread, and the one being observed
+        self.latest_frame = TelemetryRecord.empty()
+        self.frame = self.latest_frame
+        # reads the values of the telemetry, built from the first telemetry after the config is sent
+        self.telemetry_extractor: Optional[TelemetryExtractor] = None
+        # frames are numbered as they are received, observe() waits for
+        # a sequence number greater than the one of the last observation.
+        self.telemetry_cond = threading.Condition()
+        self.observed_seq = 0
+        # the episode over function is evaluated by the consumer on the observed frame,
+        # or on every frame received since the last observation (in one pass, when observing) with episode_over_every_frame
+        self.episode_over_every_frame = conf["episode_over_every_frame"]
+        self.unobserved_frames: Deque[TelemetryRecord] = deque(maxlen=self.MAX_UNOBSERVED_FRAMES)
+        self.intermediate_frames: List[TelemetryRecord] = []
+        # max time observe() waits for a telemetry, None to wait forever
+        self.observe_timeout = conf["observe_timeout"]
+        # set when no telemetry was received before the observe timeout
+        self.stalled = False
         self.missed_checkpoint = False
         self.dq = False
         self.over = False
@@ -165,35 +298,62 @@ class DonkeyUnitySimHandler(IMesgHandler):
             "need_car_config": self.on_need_car_config,
             "collision_with_starting_line": self.on_collision_with_starting_line,
         }
-        self.gyro_x = 0.0
-        self.gyro_y = 0.0
-        self.gyro_z = 0.0
-        self.accel_x = 0.0
-        self.accel_y = 0.0
-        self.accel_z = 0.0
-        self.vel_x = 0.0
-        self.vel_y = 0.0
-        self.vel_z = 0.0
-        self.lidar = []
-
-        # car in Unity lefthand coordinate system: roll is Z, pitch is X and yaw is Y
-        self.roll = 0.0
-        self.pitch = 0.0
-        self.yaw = 0.0
+        # (event loop, future) of the aobserve() calls waiting for telemetry
+        self.telemetry_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
 
         # variables required for lidar points decoding into array format
         self.lidar_deg_per_sweep_inc = 1
         self.lidar_num_sweep_levels = 1
         self.lidar_deg_ang_delta = 1
+        self.lidar_decoder = LidarDecoder()
+        # geometry of the lidar, for the point cloud
+        self.lidar_deg_ang_down = 0.0
+        self.lidar_offset = (0.0, 0.5, 0.5)
+        # number of scans (with the pose of the car) kept in the frames, for the occupancy grid
+        self.lidar_grid_scans = max(1, conf["lidar_grid_scans"])
+        self.lidar_grid_size = conf["lidar_grid_size"]
+        self.lidar_grid_resolution = conf["lidar_grid_resolution"]
+        # lidar products added to the info dict: "point_cloud" and/or "occupancy_grid"
+        self.lidar_outputs = conf["lidar_outputs"]
 
         self.last_lap_time = 0.0
         self.current_lap_time = 0.0
         self.starting_line_index = -1
         self.lap_count = 0
 
+        # max time to wait for the car to be back at the start after a reset
+        self.reset_timeout = conf["reset_timeout"]
+        # (x, y, z) of the car after a reset, learnt from the first one
+        self.spawn_pos: Optional[Tuple[float, float, float]] = None
+        self.reset_stats = LatencyStats()
+
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_event.is_set()
+
+    @loaded.setter
+    def loaded(self, value: bool) -> None:
+        if value:
+            self.loaded_event.set()
+        else:
+            self.loaded_event.clear()
+
+    def on_handshake_step(self, step: str) -> None:
+        """
+        Record the time spent since the previous step of the handshake
+        (only the first time a step happens).
+        """
+        if step in self.handshake_timings:
+            return
+        now = time.perf_counter()
+        self.handshake_timings[step] = now - self.handshake_time
+        self.handshake_time = now
+
     def on_connect(self, client: SimClient) -> None:  # pytype: disable=signature-mismatch
         logger.debug("socket connected")
         self.client = client
+        self.sent_config = {}
+        self.on_handshake_step("connect")
 
     def on_disconnect(self) -> None:
         logger.debug("socket disconnected")
@@ -205,6 +365,9 @@ class DonkeyUnitySimHandler(IMesgHandler):
     def on_need_car_config(self, message: Dict[str, Any]) -> None:
         logger.info("on need car config")
         self.loaded = True
+        self.on_handshake_step("car_loaded")
+        # the sim asks for the whole config
+        self.sent_config = {}
         self.send_config(self.conf)
 
     def on_collision_with_starting_line(self, message: Dict[str, Any]) -> None:
@@ -228,10 +391,30 @@ class DonkeyUnitySimHandler(IMesgHandler):
         return return_dict
 
     def send_config(self, conf: Dict[str, Any]) -> None:
+        """
+        Send the config messages (car, cameras, lidar) as a pipelined batch:
+        they are all queued, in order, and only the writing of the last one is waited for.
+        The messages already sent with the same values on this connection are skipped.
+        """
+        self.config_batch = []
+        try:
+            self.add_config_messages(conf)
+        finally:
+            batch, self.config_batch = self.config_batch, None
+        for msg in batch[:-1]:
+            self.queue_message(msg)
+        if batch:
+            self.blocking_send(batch[-1])
+        logger.info(f"config sent: {[msg['msg_type'] for msg in batch]}")
+        self.on_handshake_step("config")
+
+    def add_config_messages(self, conf: Dict[str, Any]) -> None:
         if "degPerSweepInc" in conf:
             raise ValueError("LIDAR config keys were renamed to use snake_case name instead of CamelCase")
 
         logger.info("sending car config.")
+        # the fields of the telemetry depend on the sensors
+        self.telemetry_extractor = None
         # both ways work, car_config shouldn't interfere with other config, so keeping the two alternative
         self.set_car_config(conf)
         if "car_config" in conf.keys():
@@ -281,7 +464,7 @@ class DonkeyUnitySimHandler(IMesgHandler):
             )
             self.send_cam_config(**cam_config_b, msg_type="cam_config_b")
             logger.info(f"done sending cam config B. {cam_config_b}")
-            self.image_array_b = np.zeros(self.camera_img_size)
+            self.image_array_b = self.frame_pool_b.zeros()
 
         if "lidar_config" in conf.keys():
             if "degPerSweepInc" in conf:
@@ -398,70 +581,247 @@ class DonkeyUnitySimHandler(IMesgHandler):
         logger.debug("reseting")
         self.send_reset_car()
         self.timer.reset()
-        time.sleep(1)
-        self.image_array = np.zeros(self.camera_img_size)
+        self.wait_for_reset()
+        self.start_episode()
+
+    async def areset(self) -> None:
+        """
+        Same as reset(), but waits for the car to be back at the start without blocking
+        the running event loop (to be used with AsyncSimClient, which receives the telemetry on that loop).
+        """
+        logger.debug("reseting")
+        self.send_reset_car()
+        self.timer.reset()
+        await self.await_reset()
+        self.start_episode()
+
+    def start_episode(self) -> None:
+        self.image_array = self.frame_pool.zeros()
         self.image_array_b = None
         self.last_obs = self.image_array
-        self.time_received = time.time()
-        self.last_received = self.time_received
-        self.hit = "none"
-        self.cte = 0.0
-        self.x = 0.0
-        self.y = 0.0
-        self.z = 0.0
-        self.speed = 0.0
-        self.forward_vel = 0.0
+        # wait for a telemetry received after the reset
+        with self.telemetry_cond:
+            frame = self.latest_frame
+            if frame.seq > self.observed_seq:
+                self.cancel_images(frame)
+            self.observed_seq = frame.seq
+            self.latest_frame = TelemetryRecord.empty(frame.seq)
+            self.frame = self.latest_frame
+            self.unobserved_frames.clear()
         self.over = False
         self.missed_checkpoint = False
         self.dq = False
-        self.gyro_x = 0.0
-        self.gyro_y = 0.0
-        self.gyro_z = 0.0
-        self.accel_x = 0.0
-        self.accel_y = 0.0
-        self.accel_z = 0.0
-        self.vel_x = 0.0
-        self.vel_y = 0.0
-        self.vel_z = 0.0
-        self.lidar = []
         self.current_lap_time = 0.0
         self.last_lap_time = 0.0
         self.lap_count = 0
 
-        # car
-        self.roll = 0.0
-        self.pitch = 0.0
-        self.yaw = 0.0
+    def wait_for_reset(self) -> None:
+        """
+        Wait until a telemetry shows the car back at the start: near the spawn point,
+        stopped and without collision. The spawn point is not known before the first reset,
+        which then waits for the whole ``reset_timeout`` (the former fixed delay).
+        """
+        start = time.perf_counter()
+        with self.telemetry_cond:
+            reset_seq = self.latest_frame.seq
+            # the telemetry received until then are not observed
+            self.observed_seq = reset_seq
+            done = self.telemetry_cond.wait_for(self.is_reset_done, self.reset_timeout)
+        self.on_reset_waited(time.perf_counter() - start, done, reset_seq)
+
+    async def await_reset(self) -> None:
+        """
+        Same as wait_for_reset(), without blocking the running event loop.
+        """
+        start = time.perf_counter()
+        with self.telemetry_cond:
+            reset_seq = self.latest_frame.seq
+            self.observed_seq = reset_seq
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.reset_timeout
+        while True:
+            with self.telemetry_cond:
+                done = self.is_reset_done()
+            remaining = deadline - loop.time()
+            if done or remaining <= 0:
+                break
+            waiter = loop.create_future()
+            self.telemetry_waiters.append((loop, waiter))
+            # telemetry may have been received before the waiter was registered
+            if self.has_new_telemetry():
+                continue
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+        self.on_reset_waited(time.perf_counter() - start, done, reset_seq)
+
+    def on_reset_waited(self, duration: float, done: bool, reset_seq: int) -> None:
+        self.reset_stats.on_sample(duration, timed_out=not done)
+        if done:
+            return
+
+        logger.debug(f"reset not detected from telemetry after {self.reset_timeout}s")
+        # learn the spawn point, if the car is still
+        frame = self.latest_frame
+        if frame.seq > reset_seq and frame.hit == "none" and abs(frame.speed) < self.RESET_SPEED_TOLERANCE:
+            self.spawn_pos = (frame.x, frame.y, frame.z)
+
+    def is_reset_done(self) -> bool:
+        # called with telemetry_cond held, for each telemetry received after the reset
+        frame = self.latest_frame
+        if frame.seq <= self.observed_seq:
+            return False
+        # consumed: a collision before the reset is not kept in the next frames
+        self.observed_seq = frame.seq
+        if self.spawn_pos is None or frame.hit != "none" or abs(frame.speed) > self.RESET_SPEED_TOLERANCE:
+            return False
+        spawn_x, _, spawn_z = self.spawn_pos
+        return math.hypot(frame.x - spawn_x, frame.z - spawn_z) < self.RESET_DISTANCE_TOLERANCE
 
     def get_sensor_size(self) -> Tuple[int, int, int]:
-        return self.camera_img_size
+        # shape of the observations, after preprocessing
+        return self.observation_shape
 
     def take_action(self, action: np.ndarray) -> None:
         self.send_control(action[0], action[1])
 
-    def observe(self) -> Tuple[np.ndarray, float, bool, Dict[str, Any]]:
-        while self.last_received == self.time_received:
-            time.sleep(0.001)
+    @property
+    def telemetry_seq(self) -> int:
+        return self.latest_frame.seq
+
+    @property
+    def time_received(self) -> float:
+        return self.latest_frame.time
+
+    def has_new_telemetry(self) -> bool:
+        return self.latest_frame.seq > self.observed_seq
+
+    def observe(self, timeout: Optional[float] = None, decode: bool = True) -> Tuple[np.ndarray, float, bool, Dict[str, Any]]:
+        """
+        Wait for a telemetry newer than the last observation.
+
+        :param timeout: max time to wait, in seconds (default: ``observe_timeout`` conf key)
+        :param decode: False to skip the images of this telemetry (e.g. a skipped frame),
+            the observation is then the previous image. They are decoded anyway if the episode is over.
+        :raises SimFailed: when no telemetry was received before the timeout,
+            the ``stalled`` flag is then set.
+        """
+        if timeout is None:
+            timeout = self.observe_timeout
+        with self.telemetry_cond:
+            if not self.telemetry_cond.wait_for(self.has_new_telemetry, timeout):
+                self.on_stalled(timeout)
+            self.stalled = False
+            frame = self.take_frame()
+
+        self.set_frame(frame, decode)
+        return self.make_observation()
+
+    async def aobserve(
+        self, timeout: Optional[float] = None, decode: bool = True
+    ) -> Tuple[np.ndarray, float, bool, Dict[str, Any]]:
+        """
+        Same as observe(), but waits for the next telemetry without blocking
+        the running event loop (to be used with AsyncSimClient).
+        """
+        if timeout is None:
+            timeout = self.observe_timeout
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while not self.has_new_telemetry():
+            waiter = loop.create_future()
+            self.telemetry_waiters.append((loop, waiter))
+            # telemetry may have been received before the waiter was registered
+            if self.has_new_telemetry():
+                break
+            remaining = None if deadline is None else max(deadline - loop.time(), 0.0)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                self.on_stalled(timeout)
+        self.stalled = False
+
+        with self.telemetry_cond:
+            frame = self.take_frame()
+        futures = [image for image in (frame.image, frame.image_b) if isinstance(image, Future)]
+        if decode and futures:
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        self.set_frame(frame, decode)
+        return self.make_observation()
+
+    def take_frame(self) -> TelemetryRecord:
+        # called with telemetry_cond held, the images of the frame won't be cancelled anymore
+        frame = self.latest_frame
+        self.observed_seq = frame.seq
+        if self.episode_over_every_frame:
+            self.intermediate_frames = [f for f in self.unobserved_frames if f.seq < frame.seq]
+            self.unobserved_frames.clear()
+        return frame
+
+    def set_frame(self, frame: TelemetryRecord, decode: bool = True) -> None:
+        """
+        Make a frame the one being observed, check if the episode is over,
+        and get its images (unless they are not needed).
+        """
+        # the episode stays over until the next reset
+        if not self.over:
+            self.check_episode_over(frame)
+        self.frame = frame
+        if not decode and not self.over:
+            return
+        if self.lazy_frames:
+            image, image_b = self.lazy_frame(frame.image), self.lazy_frame(frame.image_b)
+        else:
+            image, image_b = _image_result(self.frame_pool, frame.image), _image_result(self.frame_pool_b, frame.image_b)
+        if image is not None:
+            self.image_array = image
+        if image_b is not None:
+            self.image_array_b = image_b
 
-        self.last_received = self.time_received
+    @staticmethod
+    def cancel_images(frame: TelemetryRecord) -> None:
+        # images of a frame that won't be observed
+        for image in (frame.image, frame.image_b):
+            if isinstance(image, Future):
+                image.cancel()
+
+    def on_stalled(self, timeout: float) -> None:
+        self.stalled = True
+        logger.warning(f"no telemetry received for {timeout}s, the sim seems frozen")
+        raise SimFailed(f"no telemetry received for {timeout}s")
+
+    def check_episode_over(self, frame: TelemetryRecord) -> None:
+        """
+        Evaluate the episode over function on the observed frame, preceded by the intermediate frames
+        (received since the last observation) with ``episode_over_every_frame``: in order,
+        until one ends the episode. The function sees each frame as the one being observed.
+        """
+        frames, self.intermediate_frames = self.intermediate_frames, []
+        frames.append(frame)
+        for intermediate in frames:
+            self.frame = intermediate
+            self.determine_episode_over()
+            if self.over:
+                break
+
+    def lazy_frame(self, image: Optional[str]) -> Optional[LazyFrame]:
+        if image is None:
+            return None
+        return LazyFrame(base64.b64decode(image), self.observation_shape, self.preprocess)
+
+    def make_observation(self) -> Tuple[np.ndarray, float, bool, Dict[str, Any]]:
         observation = self.image_array
         done = self.is_game_over()
         reward = self.calc_reward(done)
 
-        info = {
-            "pos": (self.x, self.y, self.z),
-            "cte": self.cte,
-            "speed": self.speed,
-            "forward_vel": self.forward_vel,
-            "hit": self.hit,
-            "gyro": (self.gyro_x, self.gyro_y, self.gyro_z),
-            "accel": (self.accel_x, self.accel_y, self.accel_z),
-            "vel": (self.vel_x, self.vel_y, self.vel_z),
-            "lidar": (self.lidar),
-            "car": (self.roll, self.pitch, self.yaw),
-            "last_lap_time": self.last_lap_time,
-            "lap_count": self.lap_count,
-        }
+        # the values are only computed when the info dict is read
+        info = TelemetryInfo(self.frame, self.frame.extras)
+
+        if "point_cloud" in self.lidar_outputs:
+            info["lidar_point_cloud"] = self.get_lidar_point_cloud()
+        if "occupancy_grid" in self.lidar_outputs:
+            info["lidar_occupancy_grid"] = self.get_lidar_occupancy_grid()
 
         # Add the second image to the dict
         if self.image_array_b is not None:
@@ -508,69 +868,118 @@ class DonkeyUnitySimHandler(IMesgHandler):
     # ------ Socket interface ----------- #
 
     def on_telemetry(self, message: Dict[str, Any]) -> None:
-        img_string = message["image"]
-        image = Image.open(BytesIO(base64.b64decode(img_string)))
-
-        # always update the image_array as the observation loop will hang if not changing.
-        self.image_array = np.asarray(image)
-        self.time_received = time.time()
-
-        if "image_b" in message:
-            img_string_b = message["image_b"]
-            image_b = Image.open(BytesIO(base64.b64decode(img_string_b)))
-            self.image_array_b = np.asarray(image_b)
-
-        if "pos_x" in message:
-            self.x = message["pos_x"]
-            self.y = message["pos_y"]
-            self.z = message["pos_z"]
-
-        if "speed" in message:
-            self.speed = message["speed"]
-
-        e = [self.pitch * np.pi / 180.0, self.yaw * np.pi / 180.0, self.roll * np.pi / 180.0]
-        q = euler_to_quat(e)
-
-        forward = rotate_vec(q, [0.0, 0.0, 1.0])
-
-        # dot
-        self.forward_vel = forward[0] * self.vel_x + forward[1] * self.vel_y + forward[2] * self.vel_z
-
-        if "gyro_x" in message:
-            self.gyro_x = message["gyro_x"]
-            self.gyro_y = message["gyro_y"]
-            self.gyro_z = message["gyro_z"]
-        if "accel_x" in message:
-            self.accel_x = message["accel_x"]
-            self.accel_y = message["accel_y"]
-            self.accel_z = message["accel_z"]
-        if "vel_x" in message:
-            self.vel_x = message["vel_x"]
-            self.vel_y = message["vel_y"]
-            self.vel_z = message["vel_z"]
-
-        if "roll" in message:
-            self.roll = message["roll"]
-            self.pitch = message["pitch"]
-            self.yaw = message["yaw"]
-
-        # Cross track error not always present.
-        # Will be missing if path is not setup in the given scene.
-        # It should be setup in the 4 scenes available now.
-        if "cte" in message:
-            self.cte = message["cte"]
-
+        """
+        Build the frame of a telemetry and publish it.
+        The values missing from the message are the ones of the previous frame.
+        """
+        prev = self.latest_frame
+        if self.lazy_frames or not self.decode_images:
+            # only decoded if observed
+            image, image_b = message["image"], message.get("image_b")
+        elif self.decode_executor is not None:
+            image, image_b = self.submit_images(message)
+        else:
+            image = _decode_image(self.frame_pool, message["image"])
+            image_b = None
+            if "image_b" in message:
+                image_b = _decode_image(self.frame_pool_b, message["image_b"])
+
+        if not self.ready.is_set():
+            self.check_first_frame(message["image"])
+
+        extractor = self.telemetry_extractor
+        if extractor is None or not extractor.matches(message):
+            extractor = self.telemetry_extractor = TelemetryExtractor(message)
+            logger.debug(f"telemetry fields: {sorted(extractor.keys)}")
+        values = extractor.values(message, prev)
+
+        # a collision is kept until it is observed
+        if values[_HIT_INDEX] == "none" and prev.hit != "none" and prev.seq > self.observed_seq:
+            values = values[:_HIT_INDEX] + (prev.hit,) + values[_HIT_INDEX + 1 :]
+
+        # (forward_vel is computed from the frame by the consumer)
+        lidar, lidar_scans = prev.lidar, prev.lidar_scans
         if "lidar" in message:
-            self.lidar = self.process_lidar_packet(message["lidar"])
-
-        # don't update hit once session over
-        if self.over:
-            return
+            scan = self.parse_lidar_scan(message["lidar"], (values[0], values[2], values[_YAW_INDEX]))
+            lidar = self.lidar_scan_array(scan)
+            lidar_scans = (lidar_scans + (scan,))[-self.lidar_grid_scans :]
+
+        frame = TelemetryRecord._make(
+            values
+            + (
+                lidar,
+                lidar_scans,
+                self.last_lap_time,
+                self.lap_count,
+                prev.seq + 1,
+                time.time(),
+                image,
+                image_b,
+                extractor.extras(message),
+            )
+        )
+        self.publish_telemetry(frame)
 
-        if "hit" in message:
-            self.hit = message["hit"]
+    def check_first_frame(self, image: str) -> None:
+        """
+        The handshake is over once the car is loaded and a telemetry with the configured camera size is received.
+        The size is the one of the image sent by the sim (before preprocessing), read from its header.
 
-        self.determine_episode_over()
+        :param image: the encoded image of the telemetry
+        """
+        if not self.loaded:
+            return
+        header = open_image(base64.b64decode(image))
+        shape = (header.size[1], header.size[0], len(header.getbands()))
+        if shape[: len(self.camera_img_size)] == tuple(self.camera_img_size) and not self.ready.is_set():
+            self.on_handshake_step("first_frame")
+            self.handshake_timings["total"] = time.perf_counter() - self.handshake_start
+            self.ready.set()
+
+    def submit_images(self, message: Dict[str, Any]) -> Tuple[Future, Optional[Future]]:
+        """
+        Decode the images of a telemetry on the thread pool.
+        """
+        image_future = self.decode_executor.submit(_decode_image, self.frame_pool, message["image"])
+        image_b_future = None
+        if "image_b" in message:
+            image_b_future = self.decode_executor.submit(_decode_image, self.frame_pool_b, message["image_b"])
+        return image_future, image_b_future
+
+    def on_close(self) -> None:
+        if self.decode_executor is not None:
+            # the only images that can still be waiting for a decoding thread
+            # (the ones of superseded frames are cancelled when published),
+            # shutdown(cancel_futures=True) needs Python 3.9
+            with self.telemetry_cond:
+                self.cancel_images(self.latest_frame)
+                self.cancel_images(self.frame)
+            self.decode_executor.shutdown(wait=False)
+
+    def publish_telemetry(self, frame: TelemetryRecord) -> None:
+        """
+        Make a new frame the last one (a single reference swap),
+        and signal it to observe() and aobserve().
+        The images of the previous frame are not needed anymore if it was not observed.
+        """
+        with self.telemetry_cond:
+            superseded = self.latest_frame
+            self.latest_frame = frame
+            if self.episode_over_every_frame:
+                self.unobserved_frames.append(frame)
+            if superseded.seq > self.observed_seq:
+                self.cancel_images(superseded)
+            self.telemetry_cond.notify_all()
+        self.wake_up_telemetry_waiters()
+
+    def wake_up_telemetry_waiters(self) -> None:
+        """
+        Wake up the aobserve() calls waiting for a new telemetry.
+        Works from the event loop thread and from the client thread.
+        """
+        waiters, self.telemetry_waiters = self.telemetry_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_set_waiter_done, waiter)
 
     def on_cross_start(self, message: Dict[str, Any]) -> None:
         logger.info(f"crossed start line: lap_time {message['lap_time']}")
@@ -631,9 +1040,11 @@ class DonkeyUnitySimHandler(IMesgHandler):
     def on_car_loaded(self, message: Dict[str, Any]) -> None:
         logger.debug("car loaded")
         self.loaded = True
+        self.on_handshake_step("car_loaded")
         # Enable hand brake, so the car doesn't move
         self.send_control(0, 0, 1.0)
-        self.on_need_car_config({})
+        # (nothing is sent if the config was already sent on need_car_config)
+        self.send_config(self.conf)
 
     def on_recv_scene_names(self, message: Dict[str, Any]) -> None:
         if message:
@@ -641,6 +1052,7 @@ class DonkeyUnitySimHandler(IMesgHandler):
             logger.debug(f"SceneNames: {names}")
             print("loading scene", self.SceneToLoad)
             if self.SceneToLoad in names:
+                self.on_handshake_step("scene_names")
                 self.send_load_scene(self.SceneToLoad)
             else:
                 raise ValueError(f"Scene name {self.SceneToLoad} not in scene list {names}")
@@ -673,10 +1085,14 @@ class DonkeyUnitySimHandler(IMesgHandler):
         self.queue_message(msg)
 
     def send_load_scene(self, scene_name: str) -> None:
+        # the car of the new scene gets the whole config again
+        self.sent_config = {}
         msg = {"msg_type": "load_scene", "scene_name": scene_name}
         self.queue_message(msg)
 
     def send_exit_scene(self) -> None:
+        # the car is destroyed with the scene
+        self.sent_config = {}
         msg = {"msg_type": "exit_scene"}
         self.queue_message(msg)
 
@@ -707,8 +1123,7 @@ class DonkeyUnitySimHandler(IMesgHandler):
             "car_name": car_name,
             "font_size": str(font_size),
         }
-        self.blocking_send(msg)
-        time.sleep(0.1)
+        self.send_config_message(msg)
 
     def send_racer_bio(self, racer_name: str, car_name: str, bio: str, country: str, guid: str) -> None:
         # body_style = "donkey" | "bare" | "car01" choice of string
@@ -723,8 +1138,7 @@ class DonkeyUnitySimHandler(IMesgHandler):
             "country": country,
             "guid": guid,
         }
-        self.blocking_send(msg)
-        time.sleep(0.1)
+        self.send_config_message(msg)
 
     def send_cam_config(
         self,
@@ -768,8 +1182,7 @@ class DonkeyUnitySimHandler(IMesgHandler):
             "rot_y": str(rot_y),
             "rot_z": str(rot_z),
         }
-        self.blocking_send(msg)
-        time.sleep(0.1)
+        self.send_config_message(msg)
 
     def send_lidar_config(
         self,
@@ -819,30 +1232,81 @@ class DonkeyUnitySimHandler(IMesgHandler):
             "offset_z": str(offset_z),
             "rot_x": str(rot_x),
         }
-        self.blocking_send(msg)
-        time.sleep(0.1)
+        self.send_config_message(msg)
 
         self.lidar_deg_per_sweep_inc = float(deg_per_sweep_inc)
         self.lidar_num_sweep_levels = int(num_sweeps_levels)
         self.lidar_deg_ang_delta = float(deg_ang_delta)
+        self.lidar_deg_ang_down = float(deg_ang_down)
+        self.lidar_offset = (float(offset_x), float(offset_y), float(offset_z))
+
+    def process_lidar_packet(
+        self, lidar_info: List[Dict[str, float]], pose: Optional[Tuple[float, float, float]] = None
+    ) -> np.ndarray:
+        """
+        :param pose: x, z position and yaw of the car when the points were received
+            (default: the ones of the frame being observed)
+        :return: float32 array of the distances, by sweep level then angle. -1 where there is no hit.
+        """
+        if pose is None:
+            pose = (self.x, self.z, self.yaw)
+        return self.lidar_scan_array(self.parse_lidar_scan(lidar_info, pose))
+
+    @staticmethod
+    def parse_lidar_scan(lidar_info: Optional[List[Dict[str, float]]], pose: Tuple[float, float, float]) -> LidarScan:
+        # the point cloud and occupancy grid are only computed when requested
+        return LidarScan(*LidarDecoder.points_arrays(lidar_info or []), pose)
+
+    def lidar_scan_array(self, scan: LidarScan) -> np.ndarray:
+        config = (self.lidar_deg_per_sweep_inc, self.lidar_num_sweep_levels, self.lidar_deg_ang_delta)
+        if not self.lidar_decoder.matches(*config):
+            self.lidar_decoder = LidarDecoder(*config)
+        return self.lidar_decoder.scan_array(scan.rx, scan.ry, scan.d)
 
-    def process_lidar_packet(self, lidar_info: List[Dict[str, float]]) -> np.ndarray:
-        point_per_sweep = int(360 / self.lidar_deg_per_sweep_inc)
-        points_num = round(abs(self.lidar_num_sweep_levels * point_per_sweep))
-        reconstructed_lidar_info = [-1 for _ in range(points_num)]  # we chose -1 to be the "None" value
+    def get_lidar_point_cloud(self) -> np.ndarray:
+        """
+        The points of the lidar scan of the frame being observed, in the car frame (x right, y up, z forward).
 
-        if lidar_info is not None:
-            for point in lidar_info:
-                rx = point["rx"]
-                ry = point["ry"]
-                d = point["d"]
+        :return: float32 array of shape (N, 3)
+        """
+        if not self.frame.lidar_scans:
+            return np.zeros((0, 3), dtype=np.float32)
+        return self.frame.lidar_scans[-1].point_cloud(self.lidar_deg_ang_down, self.lidar_offset)
 
-                x_index = round(abs(rx / self.lidar_deg_per_sweep_inc))
-                y_index = round(abs(ry / self.lidar_deg_ang_delta))
+    def get_lidar_occupancy_grid(self, height_range: Optional[Tuple[float, float]] = None) -> np.ndarray:
+        """
+        Occupancy grid around the car, from the last ``lidar_grid_scans`` scans up to the frame being observed
+        (see ``gym_donkeycar.envs.donkey_lidar.occupancy_grid()``).
 
-                reconstructed_lidar_info[point_per_sweep * y_index + x_index] = d
+        :param height_range: only count the points with a height in this range (in the car frame)
+        :return: uint8 array, number of points per cell. The car is at the center, facing up.
+        """
+        return occupancy_grid(
+            self.frame.lidar_scans,
+            (self.x, self.z, self.yaw),
+            self.lidar_deg_ang_down,
+            self.lidar_offset,
+            self.lidar_grid_size,
+            self.lidar_grid_resolution,
+            height_range,
+        )
 
-        return np.array(reconstructed_lidar_info)
+    def send_config_message(self, msg: Dict[str, Any]) -> None:
+        """
+        Send a config message, unless the same one was already sent on this connection.
+        Within send_config(), it is added to the batch.
+        """
+        if self.client is None:
+            logger.debug(f"skipping: \n {msg}")
+            return
+        if self.sent_config.get(msg["msg_type"]) == msg:
+            logger.debug(f"{msg['msg_type']} unchanged, not sent again")
+            return
+        self.sent_config[msg["msg_type"]] = msg
+        if self.config_batch is not None:
+            self.config_batch.append(msg)
+        else:
+            self.blocking_send(msg)
 
     def blocking_send(self, msg: Dict[str, Any]) -> None:
         if self.client is None:
@@ -0,0 +1,298 @@
+"""
+file: donkey_telemetry.py
+notes: compact record of the values of a telemetry,
+    and the info dict built lazily from it.
+"""
+
+import math
+import time
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from gym_donkeycar.envs.donkey_lidar import LidarScan
+
+# keys of the telemetry message copied as is in a record, in the order of the record fields
+MESSAGE_KEYS = (
+    "pos_x",
+    "pos_y",
+    "pos_z",
+    "cte",
+    "speed",
+    "hit",
+    "gyro_x",
+    "gyro_y",
+    "gyro_z",
+    "accel_x",
+    "accel_y",
+    "accel_z",
+    "vel_x",
+    "vel_y",
+    "vel_z",
+    "roll",
+    "pitch",
+    "yaw",
+)
+# keys of the telemetry message processed by the sim handler
+HANDLED_KEYS = frozenset({"msg_type", "image", "image_b", "lidar"})
+
+
+class TelemetryRecord(NamedTuple):
+    """
+    Values of the car reported by the sim, as used by the env:
+    one frame per telemetry message, never modified once created.
+    The sim handler publishes a new frame by replacing its reference to the last one,
+    so a reader always gets the values of a single message.
+
+    The first fields are the values of ``MESSAGE_KEYS``, so a frame can be created in one pass
+    from the tuple returned by ``TelemetryExtractor.values()``.
+    Values derived from them (``forward_vel``) are computed when read, by the consumer of the frame.
+    ``image`` and ``image_b`` are the decoded images, the futures of their decoding,
+    or the encoded images when decoding is deferred to the observation (skipped frames)
+    (``image_b`` is None when the message has no second image).
+    """
+
+    x: float
+    y: float
+    z: float
+    cte: float
+    speed: float
+    hit: str
+    gyro_x: float
+    gyro_y: float
+    gyro_z: float
+    accel_x: float
+    accel_y: float
+    accel_z: float
+    vel_x: float
+    vel_y: float
+    vel_z: float
+    roll: float
+    pitch: float
+    yaw: float
+    lidar: Any
+    # the last lidar scans (up to lidar_grid_scans), with the pose of the car, oldest first
+    lidar_scans: Tuple[LidarScan, ...]
+    last_lap_time: float
+    lap_count: int
+    # number of the message, counted from the connection
+    seq: int
+    # time.time() when the message was received
+    time: float
+    image: Any
+    image_b: Any
+    # the other values of the message (fields unknown to the env), None if there are none
+    extras: Optional[Dict[str, Any]]
+
+    @classmethod
+    def empty(cls, seq: int = 0) -> "TelemetryRecord":
+        """
+        The values before the first telemetry (or right after a reset).
+
+        :param seq: number of the last message received
+        """
+        values: Dict[str, Any] = dict.fromkeys(cls._fields, 0.0)
+        values.update(
+            hit="none", lidar=[], lidar_scans=(), lap_count=0, seq=seq, time=time.time(), image=None, image_b=None, extras=None
+        )
+        return cls(**values)
+
+    @property
+    def forward_vel(self) -> float:
+        """
+        Velocity along the forward direction of the car (negative when going in reverse).
+        """
+        # quaternion of the car rotation (same as donkey_sim.euler_to_quat())
+        half_pitch, half_yaw, half_roll = math.radians(self.pitch) / 2, math.radians(self.yaw) / 2, math.radians(self.roll) / 2
+        cx, sx = math.cos(half_pitch), math.sin(half_pitch)
+        cy, sy = math.cos(half_yaw), math.sin(half_yaw)
+        cz, sz = math.cos(half_roll), math.sin(half_roll)
+        x = sz * cx * cy - cz * sx * sy
+        y = cz * sx * cy + sz * cx * sy
+        z = cz * cx * sy - sz * sx * cy
+        w = cz * cx * cy + sz * sx * sy
+        # (0, 0, 1) rotated by the quaternion
+        forward = (2.0 * (w * y + x * z), 2.0 * (y * z - w * x), 1.0 - 2.0 * (x * x + y * y))
+        return forward[0] * self.vel_x + forward[1] * self.vel_y + forward[2] * self.vel_z
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{name}={value!r}" for name, value in zip(self._fields, self) if not name.startswith("image"))
+        return f"TelemetryRecord({values})"
+
+
+class TelemetryExtractor:
+    """
+    Reads the values of the telemetry messages with a given set of keys.
+    The sim sends the same keys in every telemetry of a connection (depending on the configured sensors),
+    so the extractor is built once, from the first message, instead of checking each key of each message.
+
+    :param keys: the keys of the messages
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        keys = list(keys)
+        self.keys = frozenset(keys)
+        # all the values in one C level call, when the messages have all the keys
+        self.complete = self.keys.issuperset(MESSAGE_KEYS)
+        self.get_values = itemgetter(*MESSAGE_KEYS)
+        # the fields the env doesn't know, in the order of the message
+        self.extra_keys = tuple(key for key in keys if key not in HANDLED_KEYS and key not in MESSAGE_KEYS)
+
+    def matches(self, message: Dict[str, Any]) -> bool:
+        return message.keys() == self.keys
+
+    def values(self, message: Dict[str, Any], prev: TelemetryRecord) -> Tuple[Any, ...]:
+        """
+        :param message: the telemetry
+        :param prev: the previous frame, for the values missing from the message
+            (e.g. the cross track error is missing if no path is setup in the scene)
+        :return: the values of ``MESSAGE_KEYS``
+        """
+        if self.complete:
+            return self.get_values(message)
+        return tuple(message[key] if key in self.keys else prev[index] for index, key in enumerate(MESSAGE_KEYS))
+
+    def extras(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not self.extra_keys:
+            return None
+        return {key: message[key] for key in self.extra_keys}
+
+
+# how each key of the info dict is computed from a record
+INFO_KEYS: Dict[str, Callable[[TelemetryRecord], Any]] = {
+    "pos": lambda t: (t.x, t.y, t.z),
+    "cte": lambda t: t.cte,
+    "speed": lambda t: t.speed,
+    "forward_vel": lambda t: t.forward_vel,
+    "hit": lambda t: t.hit,
+    "gyro": lambda t: (t.gyro_x, t.gyro_y, t.gyro_z),
+    "accel": lambda t: (t.accel_x, t.accel_y, t.accel_z),
+    "vel": lambda t: (t.vel_x, t.vel_y, t.vel_z),
+    "lidar": lambda t: t.lidar,
+    "car": lambda t: (t.roll, t.pitch, t.yaw),
+    "last_lap_time": lambda t: t.last_lap_time,
+    "lap_count": lambda t: t.lap_count,
+}
+
+
+class TelemetryInfo(dict):
+    """
+    The info dict returned by ``step()``, built lazily from a telemetry record:
+    a value (and its tuple) is only created when its key is accessed,
+    most training loops never look at it.
+
+    It is a real ``dict`` (required by gymnasium's env checker): reading a key only computes that value,
+    any other use (iteration, ``len()``, ``dict(info)``, ``items()``...) computes all of them first.
+    Values can be set and removed as usual (e.g. by the ``Monitor`` wrappers),
+    and pickling (or copying) gives a plain dict.
+
+    :param record: the telemetry the values come from
+    :param extras: other values of the info dict
+    """
+
+    __slots__ = ("record", "lazy")
+
+    def __init__(self, record: TelemetryRecord, extras: Optional[Dict[str, Any]] = None):
+        # (the dict is created empty by dict.__new__)
+        self.record = record
+        # True while some values of the record are not in the dict yet
+        self.lazy = True
+        if extras:
+            dict.update(self, extras)
+
+    def is_lazy_key(self, key: object) -> bool:
+        return self.lazy and key in INFO_KEYS
+
+    def __missing__(self, key: str) -> Any:
+        if not self.is_lazy_key(key):
+            raise KeyError(key)
+        value = INFO_KEYS[key](self.record)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def materialize(self) -> None:
+        """
+        Compute all the values, the dict then behaves like a plain dict.
+        """
+        if not self.lazy:
+            return
+        self.lazy = False
+        values = {
+            key: dict.get(self, key) if dict.__contains__(self, key) else fn(self.record) for key, fn in INFO_KEYS.items()
+        }
+        # keep the usual order of the keys, followed by the other values
+        values.update(dict.items(self))
+        dict.clear(self)
+        dict.update(self, values)
+
+    def __contains__(self, key: object) -> bool:
+        return dict.__contains__(self, key) or self.is_lazy_key(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __delitem__(self, key: str) -> None:
+        self.materialize()
+        dict.__delitem__(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        self.materialize()
+        return dict.__iter__(self)
+
+    def __len__(self) -> int:
+        self.materialize()
+        return dict.__len__(self)
+
+    def __eq__(self, other: object) -> bool:
+        self.materialize()
+        if isinstance(other, TelemetryInfo):
+            other.materialize()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        self.materialize()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+    def __or__(self, other: Any) -> Dict[str, Any]:
+        return self.copy() | other
+
+    def __ror__(self, other: Any) -> Dict[str, Any]:
+        return other | self.copy()
+
+    def copy(self) -> Dict[str, Any]:  # type: ignore[override]
+        self.materialize()
+        return dict(dict.items(self))
+
+    def keys(self):  # type: ignore[override]
+        self.materialize()
+        return dict.keys(self)
+
+    def values(self):  # type: ignore[override]
+        self.materialize()
+        return dict.values(self)
+
+    def items(self):  # type: ignore[override]
+        self.materialize()
+        return dict.items(self)
+
+    def pop(self, key: str, *default: Any) -> Any:
+        self.materialize()
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self.materialize()
+        return dict.popitem(self)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        self.materialize()
+        return dict.setdefault(self, key, default)
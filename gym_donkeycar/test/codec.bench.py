@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of the json codecs available in gym_donkeycar.core.codec,
+on representative telemetry messages (160x120 camera, optional second camera and lidar)
+and on the control message sent at every step.
+"""
+
+import base64
+import io
+import json
+import timeit
+
+import numpy as np
+from PIL import Image
+
+from gym_donkeycar.core.codec import CODECS, JsonCodec
+
+
+def camera_image(width=160, height=120):
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width * height * 3).reshape((height, width, 3))
+    pixels = np.clip(gradient + rng.normal(0, 20, gradient.shape), 0, 255).astype(np.uint8)
+    jpg = io.BytesIO()
+    Image.fromarray(pixels).save(jpg, format="JPEG")
+    return base64.b64encode(jpg.getvalue()).decode()
+
+
+def telemetry_message(stereo=False, lidar_levels=0):
+    msg = {
+        "msg_type": "telemetry",
+        "steering_angle": -0.0123,
+        "throttle": 0.3,
+        "speed": 2.4567,
+        "image": camera_image(),
+        "hit": "none",
+        "pos_x": 51.234,
+        "pos_y": 0.5623,
+        "pos_z": 50.1234,
+        "time": 123.456,
+        "cte": 0.3456,
+        "gyro_x": 0.001,
+        "gyro_y": -0.002,
+        "gyro_z": 0.003,
+        "accel_x": 0.1,
+        "accel_y": 9.81,
+        "accel_z": -0.2,
+        "vel_x": 0.5,
+        "vel_y": 0.0,
+        "vel_z": 2.3,
+        "roll": 0.1,
+        "pitch": 0.2,
+        "yaw": 90.3,
+        "activeNode": 12,
+        "totalNodes": 300,
+    }
+    if stereo:
+        msg["image_b"] = camera_image()
+    if lidar_levels > 0:
+        msg["lidar"] = [
+            {"d": 12.345, "rx": float(rx), "ry": float(-level)} for level in range(lidar_levels) for rx in range(0, 360, 2)
+        ]
+    return (json.dumps(msg) + "\n").encode()
+
+
+def available_codecs():
+    codecs = []
+    for codec_class in CODECS.values():
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            print(f"{codec_class.name} not installed, skipping")
+    return codecs
+
+
+def time_per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+if __name__ == "__main__":
+    codecs = available_codecs()
+    control = {"msg_type": "control", "steering": "0.1", "throttle": "0.3", "brake": "0.0"}
+    payloads = {
+        "camera": telemetry_message(),
+        "stereo camera": telemetry_message(stereo=True),
+        "camera + lidar 1 level": telemetry_message(lidar_levels=1),
+        "camera + lidar 25 levels": telemetry_message(lidar_levels=25),
+    }
+
+    print(f"{'payload':<26} {'size':>8} " + " ".join(f"{codec.name + ' us':>12}" for codec in codecs))
+    for name, payload in payloads.items():
+        timings = [time_per_call(lambda: codec.loads(payload), number=200) for codec in codecs]
+        print(f"{name:<26} {len(payload):>8} " + " ".join(f"{t * 1e6:>12.1f}" for t in timings))
+
+    timings = [time_per_call(lambda: codec.dumps(control), number=10000) for codec in codecs]
+    print(f"{'encode control':<26} {'':>8} " + " ".join(f"{t * 1e6:>12.2f}" for t in timings))
+
+    baseline = JsonCodec()
+    frame = payloads["camera + lidar 25 levels"]
+    reference = time_per_call(lambda: baseline.loads(frame), number=200)
+    for codec in codecs:
+        if codec.name == baseline.name:
+            continue
+        t = time_per_call(lambda: codec.loads(frame), number=200)
+        print(f"{codec.name}: {(reference - t) * 1e6:.1f} us saved per lidar frame ({reference / t:.1f}x)")
@@ -0,0 +1,31 @@
+"""
+Micro-benchmark of frame stacking: rebuilding the stack with np.append every step
+(as in the ddqn example) against FrameStack, which only copies the new frame.
+"""
+
+import timeit
+
+import numpy as np
+
+from gym_donkeycar.core.frame_stack import FrameStack
+
+
+def time_per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+if __name__ == "__main__":
+    number = 2000
+    for shape in ((80, 80, 1), (120, 160, 3)):
+        frame = np.zeros(shape, dtype=np.uint8)
+        stack = np.zeros(shape[:2] + (4 * shape[2],), dtype=np.uint8)
+
+        def append():
+            global stack
+            stack = np.append(frame, stack[:, :, : 3 * shape[2]], axis=2)
+
+        frame_stack = FrameStack(4, shape)
+        frame_stack.reset(frame)
+        legacy = time_per_call(append, number)
+        pushed = time_per_call(lambda: frame_stack.push(frame), number)
+        print(f"{shape}, 4 frames: np.append {legacy * 1e6:.1f}us, FrameStack {pushed * 1e6:.1f}us, x{legacy / pushed:.1f}")
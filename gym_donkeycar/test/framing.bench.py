@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of the TCP stream framing used by SDClient.
+
+Compares the former str based framer (decode, += and find/rfind on every chunk)
+with gym_donkeycar.core.framing.FrameBuffer, on fragmented streams similar to
+the ones of client.test.py and on large telemetry frames split in many chunks.
+"""
+
+import base64
+import json
+import os
+import timeit
+
+from gym_donkeycar.core.framing import FrameBuffer
+
+
+def legacy_framer(chunks):
+    localbuffer = ""
+    frames = []
+    for data in chunks:
+        localbuffer += data.decode("utf-8")
+
+        n0 = localbuffer.find("{")
+        n1 = localbuffer.rfind("}\n")
+        if n1 >= 0 and 0 <= n0 < n1:
+            msgs = localbuffer[n0 : n1 + 1].split("\n")
+            localbuffer = localbuffer[n1:]
+            frames.extend(m for m in msgs if len(m) > 2)
+    return frames
+
+
+def frame_buffer_framer(chunks):
+    framer = FrameBuffer()
+    frames = []
+    for data in chunks:
+        framer.feed(data)
+        frames.extend(framer.frames())
+    return frames
+
+
+def split(stream, chunk_size):
+    return [stream[i : i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+
+def telemetry_stream(num_frames, image_size=60 * 1024):
+    image = base64.b64encode(os.urandom(image_size * 3 // 4)).decode()
+    msg = {
+        "msg_type": "telemetry",
+        "steering_angle": 0.0,
+        "throttle": 0.0,
+        "speed": 1.5,
+        "image": image,
+        "hit": "none",
+        "pos_x": 1.0,
+        "pos_y": 0.5,
+        "pos_z": 2.0,
+        "cte": 0.1,
+    }
+    return (json.dumps(msg) + "\n").encode() * num_frames
+
+
+def small_messages_stream(num_frames):
+    # same kind of payload as client.test.py
+    return b"".join(b'{"msg_type":"test%d"}\n' % i for i in range(num_frames))
+
+
+def run(name, stream, chunk_size, number=20):
+    chunks = split(stream, chunk_size)
+    assert [f.encode() for f in legacy_framer(chunks)] == frame_buffer_framer(chunks)
+    legacy = min(timeit.repeat(lambda: legacy_framer(chunks), number=number, repeat=3)) / number
+    new = min(timeit.repeat(lambda: frame_buffer_framer(chunks), number=number, repeat=3)) / number
+    print(f"{name:<40} {len(chunks):>7} {legacy * 1e3:>11.3f} {new * 1e3:>11.3f} {legacy / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    print(f"{'stream':<40} {'chunks':>7} {'legacy ms':>11} {'new ms':>11} {'speedup':>9}")
+    run("1000 small msgs, 7 B chunks", small_messages_stream(1000), 7)
+    run("1000 small msgs, 1460 B chunks", small_messages_stream(1000), 1460)
+    run("60 telemetry 60KB, 1460 B chunks", telemetry_stream(60), 1460)
+    run("60 telemetry 60KB, 16 KB chunks", telemetry_stream(60), 16 * 1024)
+    run("60 telemetry 60KB, 256 KB chunks", telemetry_stream(60), 256 * 1024)
+    run("10 telemetry 500KB, 1460 B chunks", telemetry_stream(10, 500 * 1024), 1460, number=3)
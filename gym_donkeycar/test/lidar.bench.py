@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the reconstruction of the lidar scan from the points
+of a telemetry message: the former pure Python loop against LidarDecoder,
+for several lidar configurations.
+"""
+
+import timeit
+
+import numpy as np
+
+from gym_donkeycar.envs.donkey_lidar import LidarDecoder
+
+
+def legacy_process_lidar_packet(lidar_info, deg_per_sweep_inc, num_sweep_levels, deg_ang_delta):
+    point_per_sweep = int(360 / deg_per_sweep_inc)
+    points_num = round(abs(num_sweep_levels * point_per_sweep))
+    reconstructed_lidar_info = [-1 for _ in range(points_num)]
+
+    if lidar_info is not None:
+        for point in lidar_info:
+            rx = point["rx"]
+            ry = point["ry"]
+            d = point["d"]
+
+            x_index = round(abs(rx / deg_per_sweep_inc))
+            y_index = round(abs(ry / deg_ang_delta))
+
+            reconstructed_lidar_info[point_per_sweep * y_index + x_index] = d
+
+    return np.array(reconstructed_lidar_info)
+
+
+def lidar_points(deg_per_sweep_inc, num_sweep_levels, deg_ang_delta, hit_ratio=0.8):
+    rng = np.random.default_rng(0)
+    points = []
+    for level in range(num_sweep_levels):
+        for rx in np.arange(0, 360, deg_per_sweep_inc):
+            if rng.random() < hit_ratio:
+                points.append({"d": float(rng.uniform(0.5, 50.0)), "rx": float(rx), "ry": float(level * deg_ang_delta)})
+    return points
+
+
+def time_per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+if __name__ == "__main__":
+    configs = {
+        "1 level, 2 deg": (2.0, 1, -1.0),
+        "1 level, 0.5 deg": (0.5, 1, -1.0),
+        "10 levels, 2 deg": (2.0, 10, -1.0),
+        "25 levels, 2 deg": (2.0, 25, -1.0),
+    }
+
+    print(f"{'config':<20} {'points':>7} {'legacy us':>10} {'numpy us':>10} {'speedup':>8}")
+    for name, config in configs.items():
+        points = lidar_points(*config)
+        decoder = LidarDecoder(*config)
+        expected = legacy_process_lidar_packet(points, *config)
+        assert np.allclose(decoder.decode(points), expected)
+
+        legacy = time_per_call(lambda: legacy_process_lidar_packet(points, *config), number=100)
+        current = time_per_call(lambda: decoder.decode(points), number=100)
+        print(f"{name:<20} {len(points):>7} {legacy * 1e6:>10.1f} {current * 1e6:>10.1f} {legacy / current:>7.1f}x")
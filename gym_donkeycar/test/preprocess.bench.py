@@ -0,0 +1,47 @@
+"""
+Micro-benchmark of the preprocessing of a camera image (640x480 JPEG to 80x80 grayscale):
+full decode then numpy grayscale and resize (as in the ddqn example)
+against ImagePreprocessor, which decodes the JPEG at a reduced scale, luma only.
+"""
+
+import timeit
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from gym_donkeycar.core.image import FramePool, ImagePreprocessor
+
+
+def camera_image(width=640, height=480):
+    rng = np.random.default_rng(0)
+    # smooth gradients with some noise, close to a rendered scene
+    x = np.linspace(0, 255, width)[None, :, None]
+    y = np.linspace(0, 255, height)[:, None, None]
+    pixels = (x * 0.5 + y * 0.5 + rng.normal(0, 10, (height, width, 3))).clip(0, 255).astype(np.uint8)
+    jpg = BytesIO()
+    Image.fromarray(pixels).save(jpg, format="JPEG", quality=90)
+    return jpg.getvalue()
+
+
+def full_decode_then_preprocess(data, size=(80, 80)):
+    rgb = np.asarray(Image.open(BytesIO(data)))
+    gray = np.dot(rgb[..., :3], [0.299, 0.587, 0.114])
+    return np.asarray(Image.fromarray(gray.astype(np.uint8)).resize(size, Image.BILINEAR))
+
+
+def time_per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+if __name__ == "__main__":
+    data = camera_image()
+    preprocess = ImagePreprocessor((480, 640, 3), resolution=(80, 80), grayscale=True)
+    pool = FramePool(preprocess.output_shape, preprocess=preprocess)
+    number = 200
+    legacy = time_per_call(lambda: full_decode_then_preprocess(data), number)
+    preprocessed = time_per_call(lambda: pool.decode(data), number)
+    print(
+        f"full decode + numpy: {legacy * 1e3:.2f}ms, "
+        f"preprocessed decode: {preprocessed * 1e3:.3f}ms, x{legacy / preprocessed:.1f}"
+    )
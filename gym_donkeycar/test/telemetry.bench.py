@@ -0,0 +1,100 @@
+"""
+Micro-benchmark of the extraction of the values of a telemetry message
+into a record: the former chain of key checks against TelemetryExtractor.
+"""
+
+import timeit
+
+from gym_donkeycar.envs.donkey_telemetry import TelemetryExtractor, TelemetryRecord
+
+
+def telemetry_message():
+    message = {
+        "msg_type": "telemetry",
+        "steering_angle": 0.1,
+        "throttle": 0.3,
+        "speed": 2.5,
+        "image": "",
+        "hit": "none",
+        "time": 12.5,
+        "activeNode": 12,
+        "totalNodes": 200,
+        "on_road": 1,
+        "progress_on_shortest_path": 0.1,
+    }
+    for i, key in enumerate(("pos", "gyro", "accel", "vel")):
+        message.update({f"{key}_x": 0.1 * i, f"{key}_y": 0.2 * i, f"{key}_z": 0.3 * i})
+    message.update(roll=0.5, pitch=1.0, yaw=90.0, cte=0.2)
+    return message
+
+
+def legacy_values(message, prev):
+    x, y, z = prev.x, prev.y, prev.z
+    if "pos_x" in message:
+        x, y, z = message["pos_x"], message["pos_y"], message["pos_z"]
+    gyro_x, gyro_y, gyro_z = prev.gyro_x, prev.gyro_y, prev.gyro_z
+    if "gyro_x" in message:
+        gyro_x, gyro_y, gyro_z = message["gyro_x"], message["gyro_y"], message["gyro_z"]
+    accel_x, accel_y, accel_z = prev.accel_x, prev.accel_y, prev.accel_z
+    if "accel_x" in message:
+        accel_x, accel_y, accel_z = message["accel_x"], message["accel_y"], message["accel_z"]
+    vel_x, vel_y, vel_z = prev.vel_x, prev.vel_y, prev.vel_z
+    if "vel_x" in message:
+        vel_x, vel_y, vel_z = message["vel_x"], message["vel_y"], message["vel_z"]
+    roll, pitch, yaw = prev.roll, prev.pitch, prev.yaw
+    if "roll" in message:
+        roll, pitch, yaw = message["roll"], message["pitch"], message["yaw"]
+    return TelemetryRecord(
+        x=x,
+        y=y,
+        z=z,
+        cte=message.get("cte", prev.cte),
+        speed=message.get("speed", prev.speed),
+        hit=message.get("hit", prev.hit),
+        gyro_x=gyro_x,
+        gyro_y=gyro_y,
+        gyro_z=gyro_z,
+        accel_x=accel_x,
+        accel_y=accel_y,
+        accel_z=accel_z,
+        vel_x=vel_x,
+        vel_y=vel_y,
+        vel_z=vel_z,
+        roll=roll,
+        pitch=pitch,
+        yaw=yaw,
+        lidar=prev.lidar,
+        lidar_scans=prev.lidar_scans,
+        last_lap_time=0.0,
+        lap_count=0,
+        seq=prev.seq + 1,
+        time=0.0,
+        image=None,
+        image_b=None,
+        extras=None,
+    )
+
+
+def extractor_values(extractor, message, prev, with_extras=True):
+    if not extractor.matches(message):
+        raise AssertionError("unexpected message fields")
+    values = extractor.values(message, prev)
+    extras = extractor.extras(message) if with_extras else None
+    return TelemetryRecord._make(values + (prev.lidar, prev.lidar_scans, 0.0, 0, prev.seq + 1, 0.0, None, None, extras))
+
+
+def time_per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+if __name__ == "__main__":
+    message = telemetry_message()
+    prev = TelemetryRecord.empty()
+    extractor = TelemetryExtractor(message)
+    number = 100_000
+    legacy = time_per_call(lambda: legacy_values(message, prev), number)
+    print(f"key checks: {legacy * 1e6:.2f}us")
+    for with_extras in (False, True):
+        extracted = time_per_call(lambda: extractor_values(extractor, message, prev, with_extras), number)
+        label = "with" if with_extras else "without"
+        print(f"extractor {label} the unknown fields: {extracted * 1e6:.2f}us, x{legacy / extracted:.1f}")
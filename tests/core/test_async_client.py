@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.async_client` package."""
+
+import asyncio
+import json
+
+from gym_donkeycar.core.async_client import AsyncSimClient
+from gym_donkeycar.core.message import IMesgHandler
+
+
+class RecordingHandler(IMesgHandler):
+    def __init__(self):
+        self.client = None
+        self.received = []
+        self.closed = False
+
+    def on_connect(self, client):
+        self.client = client
+
+    def on_recv_message(self, message):
+        self.received.append(message)
+
+    def on_close(self):
+        self.closed = True
+
+
+async def run_client():
+    connections = asyncio.Queue()
+
+    async def on_connection(reader, writer):
+        await connections.put((reader, writer))
+
+    server = await asyncio.start_server(on_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    handler = RecordingHandler()
+    client = AsyncSimClient(("127.0.0.1", port), handler)
+    await client.connect()
+    reader, writer = await connections.get()
+    assert handler.client is client
+
+    # outgoing messages
+    await client.send({"msg_type": "control", "steering": "0.0"})
+    data = await reader.read(1024)
+    assert json.loads(data) == {"msg_type": "control", "steering": "0.0"}
+
+    # incoming messages, fragmented
+    telemetry = client.telemetry()
+    writer.write(b'{"msg_type":"car_loaded"}\n{"msg_type":"telemetry","sp')
+    writer.write(b'eed":1.5}\n')
+    message = await asyncio.wait_for(telemetry.__anext__(), timeout=2.0)
+    assert message == {"msg_type": "telemetry", "speed": 1.5}
+    assert [m["msg_type"] for m in handler.received] == ["car_loaded", "telemetry"]
+
+    await client.close()
+    assert handler.closed
+    writer.close()
+    server.close()
+    await server.wait_closed()
+
+
+def test_async_sim_client():
+    asyncio.run(run_client())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.client` package."""
+
+import socket
+import time
+
+import pytest
+
+from gym_donkeycar.core.client import SDClient
+from gym_donkeycar.core.reactor import SocketReactor
+
+
+class RecordingClient(SDClient):
+    def __init__(self, *args, **kwargs):
+        self.received = []
+        super().__init__(*args, **kwargs)
+
+    def on_msg_recv(self, j):
+        self.received.append(j)
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return predicate()
+
+
+@pytest.fixture
+def server():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    yield listener
+    listener.close()
+
+
+def connect(server, client_cls=RecordingClient, **kwargs):
+    client = client_cls("127.0.0.1", server.getsockname()[1], **kwargs)
+    conn, _ = server.accept()
+    return client, conn
+
+
+def test_receive_messages(server):
+    client, conn = connect(server)
+    try:
+        conn.sendall(b'{"msg_type":"test1"}\n{"msg_type":')
+        assert wait_for(lambda: len(client.received) == 1)
+        conn.sendall(b'"test2"}\n')
+        assert wait_for(lambda: len(client.received) == 2)
+        assert [m["msg_type"] for m in client.received] == ["test1", "test2"]
+    finally:
+        client.stop()
+        conn.close()
+
+
+def test_send_wakes_up_loop(server):
+    client, conn = connect(server)
+    try:
+        conn.settimeout(2.0)
+        client.send('{"msg_type":"control"}')
+        assert conn.recv(1024) == b'{"msg_type":"control"}'
+    finally:
+        client.stop()
+        conn.close()
+
+
+def test_stop_returns_while_idle(server):
+    client, conn = connect(server)
+    start = time.time()
+    client.stop()
+    conn.close()
+    assert not client.th.is_alive()
+    assert time.time() - start < 1.0
+
+
+def test_shared_reactor(server):
+    reactor = SocketReactor()
+    client1, conn1 = connect(server, reactor=reactor)
+    client2, conn2 = connect(server, reactor=reactor)
+    try:
+        assert client1.th is client2.th
+        assert len(reactor) == 2
+        conn1.sendall(b'{"msg_type":"test1"}\n')
+        conn2.sendall(b'{"msg_type":"test2"}\n')
+        assert wait_for(lambda: len(client1.received) == 1 and len(client2.received) == 1)
+        assert client1.received[0]["msg_type"] == "test1"
+        assert client2.received[0]["msg_type"] == "test2"
+
+        client1.stop()
+        assert reactor.is_running()
+        conn2.sendall(b'{"msg_type":"test3"}\n')
+        assert wait_for(lambda: len(client2.received) == 2)
+    finally:
+        client1.stop()
+        client2.stop()
+        reactor.stop()
+        conn1.close()
+        conn2.close()
+    assert not reactor.is_running()
+
+
+def test_socket_options(server):
+    client, conn = connect(server, rcvbuf_size=1024 * 128)
+    try:
+        assert client.s.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY) != 0
+        # linux doubles the requested size
+        assert client.s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 1024 * 128
+    finally:
+        client.stop()
+        conn.close()
+
+    client, conn = connect(server, tcp_nodelay=False)
+    try:
+        assert client.s.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY) == 0
+    finally:
+        client.stop()
+        conn.close()
+
+
+def test_transport_stats(server):
+    client, conn = connect(server, recv_size=16)
+    try:
+        conn.settimeout(2.0)
+        frame = b'{"msg_type":"telemetry","speed":1.0}\n'
+        conn.sendall(frame * 2)
+        assert wait_for(lambda: len(client.received) == 2)
+        assert client.stats.frames_in == 2
+        assert client.stats.bytes_in == 2 * len(frame)
+        assert client.stats.avg_frame_size == len(frame)
+        # the frames are larger than the recv size
+        assert client.stats.recv_calls_per_frame > 1
+
+        client.send_now(b'{"msg_type":"control"}')
+        assert client.stats.frames_out == 1
+        assert client.stats.bytes_out == len(b'{"msg_type":"control"}')
+    finally:
+        client.stop()
+        conn.close()
+
+
+def test_latest_only(server):
+    client, conn = connect(server, latest_only=("telemetry",))
+    try:
+        # a backlog of telemetry, with an event in the middle
+        frames = [b'{"msg_type":"telemetry","hit":"none","time":%d}\n' % i for i in range(100)]
+        frames.insert(50, b'{"msg_type":"DQ"}\n')
+        conn.sendall(b"".join(frames))
+        assert wait_for(lambda: any(m["msg_type"] == "telemetry" and m["time"] == 99 for m in client.received))
+        msg_types = [m["msg_type"] for m in client.received]
+        assert "DQ" in msg_types
+        assert msg_types.count("telemetry") < 100
+        assert client.stats.frames_dropped == 101 - len(client.received)
+    finally:
+        client.stop()
+        conn.close()
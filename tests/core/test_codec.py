@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.codec` package."""
+
+import math
+
+import pytest
+
+from gym_donkeycar.core.codec import CODECS, JsonCodec, get_codec
+
+
+def test_get_codec():
+    assert isinstance(get_codec("auto"), JsonCodec)
+    assert get_codec("json").name == "json"
+    codec = JsonCodec()
+    assert get_codec(codec) is codec
+    with pytest.raises(ValueError):
+        get_codec("pickle")
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_round_trip(name):
+    try:
+        codec = CODECS[name]()
+    except ImportError:
+        pytest.skip(f"{name} not installed")
+
+    msg = {"msg_type": "control", "steering": "0.1", "throttle": "0.3"}
+    assert codec.loads(codec.dumps(msg)) == msg
+    assert codec.loads(b'{"msg_type":"telemetry","speed":1.5}\n') == {"msg_type": "telemetry", "speed": 1.5}
+    # not valid json, but accepted by the standard library
+    assert math.isnan(codec.loads(b'{"msg_type":"telemetry","cte":NaN}')["cte"])
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.frame_stack` package."""
+
+import numpy as np
+import pytest
+
+from gym_donkeycar.core.frame_stack import FrameStack
+
+
+def frame(value):
+    return np.full((2, 3), value, dtype=np.uint8)
+
+
+def test_stack():
+    frame_stack = FrameStack(3, (2, 3), capacity=6)
+    assert frame_stack.shape == (3, 2, 3)
+    stack = frame_stack.reset(frame(1))
+    assert stack.shape == (3, 2, 3)
+    assert stack[:, 0, 0].tolist() == [1, 1, 1]
+    with pytest.raises(ValueError):
+        stack[0, 0, 0] = 0
+
+    # the stacks returned are never modified, even when the buffer is full
+    stacks = [frame_stack.push(frame(i)) for i in range(2, 20)]
+    assert [stack[:, 0, 0].tolist() for stack in stacks[:3]] == [[1, 1, 2], [1, 2, 3], [2, 3, 4]]
+    assert all(stack[:, 0, 0].tolist() == [i, i + 1, i + 2] for i, stack in enumerate(stacks[2:], start=2))
+
+
+def test_buffers_reused():
+    frame_stack = FrameStack(2, (2, 3), capacity=4)
+    stack = frame_stack.reset(frame(0))
+    buffers = set()
+    for i in range(20):
+        # the previous stack is still referenced while pushing
+        stack = frame_stack.push(frame(i))
+        buffers.add(id(frame_stack.buffer))
+    assert stack[:, 0, 0].tolist() == [18, 19]
+    assert len(buffers) == 2
+
+    # no stack referenced: the frames are moved within the buffer
+    buffer_id = id(frame_stack.buffer)
+    del stack
+    for i in range(20):
+        frame_stack.push(frame(i))
+    assert id(frame_stack.buffer) == buffer_id
+    assert frame_stack.stack()[:, 0, 0].tolist() == [18, 19]
+
+    with pytest.raises(ValueError):
+        FrameStack(4, (2, 3), capacity=6)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.framing` package."""
+
+from gym_donkeycar.core.framing import FrameBuffer, drop_stale_frames, peek_msg_type
+
+
+def test_complete_frames():
+    framer = FrameBuffer()
+    framer.feed(b'{"msg_type":"test1"}\n{"msg_type":"test2"}\n')
+    assert framer.frames() == [b'{"msg_type":"test1"}', b'{"msg_type":"test2"}']
+    assert len(framer) == 0
+
+
+def test_fragmented_frames():
+    framer = FrameBuffer()
+    framer.feed(b'{"msg_type":"test7"')
+    assert framer.frames() == []
+    framer.feed(b'}\n{"msg_type":"test71"}\n{"msg_type":')
+    assert framer.frames() == [b'{"msg_type":"test7"}', b'{"msg_type":"test71"}']
+    framer.feed(b'"test72"}\n')
+    assert framer.frames() == [b'{"msg_type":"test72"}']
+
+
+def test_skip_empty_lines():
+    framer = FrameBuffer()
+    framer.feed(b'\n\r\n{"msg_type":"test8"}\r\n}\n')
+    assert framer.frames() == [b'{"msg_type":"test8"}']
+
+
+def test_grow_buffer():
+    framer = FrameBuffer(initial_size=16)
+    payload = b'{"msg_type":"telemetry","image":"' + b"A" * 1000 + b'"}'
+    for i in range(0, len(payload), 7):
+        framer.feed(payload[i : i + 7])
+        assert framer.frames() == []
+    framer.feed(b"\n")
+    assert framer.frames() == [payload]
+
+
+def test_peek_msg_type():
+    assert peek_msg_type(b'{"msg_type":"telemetry","speed":1.0}') == "telemetry"
+    assert peek_msg_type(b'{"speed":1.0, "msg_type" : "DQ"}') == "DQ"
+    assert peek_msg_type(b'{"speed":1.0}') is None
+
+
+def test_drop_stale_frames():
+    telemetry = [b'{"msg_type":"telemetry","hit":"none","time":%d}' % i for i in range(3)]
+    hit = b'{"msg_type":"telemetry","hit":"wall","time":10}'
+    dq = b'{"msg_type":"DQ"}'
+    checkpoint = b'{"msg_type":"missed_checkpoint"}'
+
+    frames = [telemetry[0], dq, telemetry[1], checkpoint, telemetry[2]]
+    assert drop_stale_frames(frames, {"telemetry"}) == [dq, checkpoint, telemetry[2]]
+    assert drop_stale_frames(frames, set()) == frames
+    # collisions are never skipped
+    assert drop_stale_frames([hit, telemetry[0], telemetry[1]], {"telemetry"}) == [hit, telemetry[1]]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.image` package."""
+
+import pickle
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from gym_donkeycar.core.image import FramePool, ImagePreprocessor, LazyFrame
+
+
+def encode(color, size=(160, 120), mode="RGB", format="PNG"):
+    jpg = BytesIO()
+    Image.new(mode, size, color).save(jpg, format=format)
+    return jpg.getvalue()
+
+
+def test_decode():
+    pool = FramePool((120, 160, 3))
+    image = pool.decode(encode((10, 20, 30)))
+    assert image.shape == (120, 160, 3)
+    assert image.dtype == np.uint8
+    assert tuple(image[0, 0]) == (10, 20, 30)
+    with pytest.raises(ValueError):
+        image[0, 0] = 0
+
+    zeros = pool.zeros()
+    assert zeros.dtype == np.uint8 and not zeros.any()
+
+
+def test_buffers_not_reused_while_referenced():
+    pool = FramePool((120, 160, 3))
+    images = [pool.decode(encode((i, i, i))) for i in range(4)]
+    # all the images are still referenced, none was overwritten
+    assert [int(image[0, 0, 0]) for image in images] == [0, 1, 2, 3]
+    assert len(pool.buffers) == 4
+
+    del images
+    for i in range(10):
+        pool.decode(encode((i, i, i)))
+    assert len(pool.buffers) == 4
+
+    # only a view of the last image is kept, the other buffer is reused
+    pool = FramePool((120, 160, 3))
+    image = pool.decode(encode((1, 1, 1)))
+    for i in range(10):
+        image = pool.decode(encode((i, i, i)))
+    assert len(pool.buffers) == 2
+
+
+def test_shape_mismatch():
+    pool = FramePool((120, 160, 3))
+    image = pool.decode(encode(50, size=(64, 64), mode="L"))
+    assert image.shape == (64, 64)
+    assert len(pool.buffers) == 0
+
+    pool = FramePool((120, 160, 1))
+    image = pool.decode(encode(50, mode="L"))
+    assert image.shape == (120, 160, 1)
+    assert image[0, 0, 0] == 50
+
+
+def test_preprocess():
+    # red top rows, cropped out
+    image = Image.new("RGB", (640, 480), (0, 0, 255))
+    image.paste((255, 0, 0), (0, 0, 640, 40))
+    jpg = BytesIO()
+    image.save(jpg, format="JPEG", quality=95)
+
+    preprocess = ImagePreprocessor((480, 640, 3), resolution=(80, 80), crop=(40, 0, 0, 0), channel_order="bgr")
+    assert preprocess.output_shape == (80, 80, 3)
+    pool = FramePool(preprocess.output_shape, preprocess=preprocess)
+    observation = pool.decode(jpg.getvalue())
+    assert observation.shape == (80, 80, 3)
+    # blue in BGR order
+    np.testing.assert_allclose(observation[0, 0], (255, 0, 0), atol=8)
+
+    preprocess = ImagePreprocessor((480, 640, 3), resolution=(60, 80), grayscale=True)
+    opened = Image.open(BytesIO(jpg.getvalue()))
+    result = preprocess.apply(opened)
+    # decoded at 1/8 scale, only the luma
+    assert opened.size == (80, 60) and opened.mode == "L"
+    assert result.size == (80, 60) and result.mode == "L"
+    pool = FramePool(preprocess.output_shape, preprocess=preprocess)
+    assert pool.decode(jpg.getvalue()).shape == (60, 80, 1)
+
+    # PNG images are cropped only
+    preprocess = ImagePreprocessor((120, 160, 3), crop=(10, 0, 0, 0))
+    assert preprocess.output_shape == (110, 160, 3)
+    pool = FramePool(preprocess.output_shape, preprocess=preprocess)
+    assert tuple(pool.decode(encode((10, 20, 30)))[0, 0]) == (10, 20, 30)
+
+    with pytest.raises(ValueError):
+        ImagePreprocessor((120, 160, 3), crop=(60, 60, 0, 0))
+
+
+def test_lazy_frame():
+    data = encode((10, 20, 30))
+    frame = LazyFrame(data, (120, 160, 3))
+    assert frame.data is data
+    assert frame.shape == (120, 160, 3)
+    assert frame.array is None
+
+    image = np.asarray(frame)
+    assert image.shape == (120, 160, 3) and image.dtype == np.uint8
+    assert tuple(frame[0, 0]) == (10, 20, 30)
+    # decoded once
+    assert np.asarray(frame) is image
+    assert np.array(frame).flags.writeable
+    assert np.stack([frame, frame]).shape == (2, 120, 160, 3)
+
+    # only the encoded image is pickled
+    copy = pickle.loads(pickle.dumps(frame))
+    assert copy.data == data and copy.array is None
+    assert len(pickle.dumps(frame)) < image.nbytes
+
+    # the decoded images of the last frames used are kept
+    frames = [LazyFrame(data, (120, 160, 3)) for _ in range(LazyFrame.cache_size)]
+    for other in frames:
+        np.asarray(other)
+    assert frame.array is None
+    assert all(other.array is not None for other in frames)
+
+
+def test_lazy_frame_preprocess():
+    preprocess = ImagePreprocessor((120, 160, 3), resolution=(60, 80), grayscale=True)
+    frame = LazyFrame(encode((10, 20, 30), format="JPEG"), preprocess.output_shape, preprocess)
+    assert np.asarray(frame).shape == (60, 80, 1)
+
+    preprocess = ImagePreprocessor((120, 160, 3), channel_order="bgr")
+    frame = LazyFrame(encode((10, 20, 30)), preprocess.output_shape, preprocess)
+    assert tuple(frame[0, 0]) == (30, 20, 10)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.message_queue` package."""
+
+import threading
+from queue import Full
+
+import pytest
+
+from gym_donkeycar.core.message_queue import OutboundQueue
+
+
+def drain(queue):
+    messages = []
+    pending = queue.get()
+    while pending is not None:
+        ticket, data = pending
+        queue.mark_written(ticket)
+        messages.append(data)
+        pending = queue.get()
+    return messages
+
+
+def test_control_coalesced_in_order():
+    queue = OutboundQueue()
+    queue.put(b"control1", "control")
+    queue.put(b"control2", "control")
+    queue.put(b"reset_car")
+    queue.put(b"exit_scene")
+    queue.put(b"control3", "control")
+
+    assert drain(queue) == [b"control2", b"reset_car", b"exit_scene", b"control3"]
+    assert queue.coalesced == 1
+    assert queue.dropped == 0
+    assert queue.sent == 4
+
+
+def test_drop_control_when_full():
+    queue = OutboundQueue(maxsize=2)
+    queue.put(b"control1", "control")
+    queue.put(b"car_config")
+    queue.put(b"load_scene")
+
+    assert drain(queue) == [b"car_config", b"load_scene"]
+    assert queue.dropped == 1
+
+
+def test_lifecycle_messages_never_dropped():
+    queue = OutboundQueue(maxsize=2)
+    queue.put(b"car_config")
+    queue.put(b"load_scene")
+    # the new command is dropped, not the queued messages
+    ticket = queue.put(b"control1", "control")
+    assert queue.dropped == 1
+    assert not queue.wait_written(ticket, timeout=1.0)
+
+    with pytest.raises(Full):
+        queue.put(b"reset_car", block=False)
+    with pytest.raises(Full):
+        queue.put(b"reset_car", timeout=0.01)
+
+    # room is made while waiting
+    timer = threading.Timer(0.05, queue.get)
+    timer.start()
+    queue.put(b"reset_car", timeout=2.0)
+    timer.join()
+    assert drain(queue) == [b"load_scene", b"reset_car"]
+
+
+def test_wait_written():
+    queue = OutboundQueue()
+    first = queue.put(b"control1", "control")
+    second = queue.put(b"control2", "control")
+    assert not queue.wait_written(first, timeout=0.01)
+
+    drain(queue)
+    assert queue.wait_written(first, timeout=0.01)
+    assert queue.wait_written(second, timeout=0.01)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.stats` package."""
+
+from gym_donkeycar.core.stats import LatencyStats, TransportStats
+
+
+def test_transport_stats():
+    stats = TransportStats()
+    assert stats.avg_frame_size == 0.0
+    assert stats.recv_calls_per_frame == 0.0
+
+    stats.on_recv(100)
+    stats.on_recv(200)
+    stats.on_frames(2)
+    stats.on_send(10)
+    stats.on_frame_sent()
+
+    assert stats.bytes_in == 300
+    assert stats.frames_in == 2
+    assert stats.avg_frame_size == 150
+    assert stats.recv_calls_per_frame == 1.0
+    assert stats.fps > 0
+    assert stats.as_dict()["bytes_out"] == 10
+
+    stats.reset()
+    assert stats.bytes_in == 0 and stats.frames_out == 0
+
+
+def test_latency_stats():
+    stats = LatencyStats()
+    assert stats.mean == 0.0
+    assert stats.as_dict()["min"] == 0.0
+
+    stats.on_sample(0.1)
+    stats.on_sample(0.3, timed_out=True)
+    assert stats.count == 2
+    assert stats.timeouts == 1
+    assert abs(stats.mean - 0.2) < 1e-9
+    assert (stats.min, stats.max, stats.last) == (0.1, 0.3, 0.3)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.core.util` package."""
+
+from gym_donkeycar.core.codec import JsonCodec
+from gym_donkeycar.core.framing import parse_frame
+from gym_donkeycar.core.util import FloatNotationFixer, replace_float_notation
+
+
+def test_replace_float_notation():
+    assert replace_float_notation('{"a":1,5,"b":-2,25E-05,"c":3}') == '{"a":1.5,"b":-2.25E-05,"c":3}'
+    assert replace_float_notation(b'{"a":1,"b":"1,5","c":[{"d":0,5}]}') == b'{"a":1,"b":"1,5","c":[{"d":0.5}]}'
+
+
+def test_detect_comma_notation():
+    codec = JsonCodec()
+    fixer = FloatNotationFixer()
+    assert parse_frame(b'{"msg_type":"telemetry","speed":1.5}', codec, fixer) == {"msg_type": "telemetry", "speed": 1.5}
+    assert fixer.detecting
+
+    assert parse_frame(b'{"msg_type":"telemetry","speed":1,5}', codec, fixer) == {"msg_type": "telemetry", "speed": 1.5}
+    assert fixer.enabled
+
+
+def test_disabled_fixer():
+    fixer = FloatNotationFixer(enabled=False)
+    assert parse_frame(b'{"msg_type":"telemetry","speed":1,5}', JsonCodec(), fixer) is None
+    assert not fixer.enabled
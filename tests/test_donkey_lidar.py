@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.envs.donkey_lidar` module."""
+
+import numpy as np
+
+from gym_donkeycar.envs.donkey_lidar import NO_HIT, LidarDecoder, LidarScan, occupancy_grid
+
+
+def test_decode():
+    decoder = LidarDecoder(deg_per_sweep_inc=2.0, num_sweep_levels=2, deg_ang_delta=-1.0)
+    assert decoder.num_points == 360
+
+    points = [
+        {"rx": 0.0, "ry": 0.0, "d": 1.5},
+        {"rx": 4.0, "ry": 0.0, "d": 2.5},
+        {"rx": 358.0, "ry": -1.0, "d": 3.5},
+        # outside of the configured scan
+        {"rx": 0.0, "ry": -5.0, "d": 4.5},
+    ]
+    scan = decoder.decode(points)
+    assert scan.dtype == np.float32
+    assert scan.shape == (360,)
+    assert scan[0] == 1.5
+    assert scan[1] == NO_HIT
+    assert scan[2] == 2.5
+    assert scan[180 + 179] == 3.5
+    assert np.count_nonzero(scan != NO_HIT) == 3
+
+    # the scans returned are independent arrays
+    empty = decoder.decode(None)
+    assert (empty == NO_HIT).all()
+    assert scan[0] == 1.5
+    assert decoder.matches(2.0, 2, -1.0)
+    assert not decoder.matches(1.0, 2, -1.0)
+
+
+def make_scan(points, pose=(0.0, 0.0, 0.0)):
+    return LidarScan(*LidarDecoder.points_arrays(points), pose)
+
+
+def test_point_cloud():
+    scan = make_scan(
+        [
+            {"rx": 0.0, "ry": 0.0, "d": 2.0},
+            {"rx": 90.0, "ry": 0.0, "d": 3.0},
+            {"rx": 0.0, "ry": -10.0, "d": 2.0},
+        ]
+    )
+    cloud = scan.point_cloud(deg_ang_down=10.0, offset=(0.0, 0.5, 0.0))
+    assert cloud.dtype == np.float32
+    assert cloud.shape == (3, 3)
+    # 10 degrees down, in front of the car
+    np.testing.assert_allclose(cloud[0], [0.0, 0.5 - 2.0 * np.sin(np.radians(10)), 2.0 * np.cos(np.radians(10))], atol=1e-6)
+    # on the right
+    assert cloud[1, 0] > 2.9 and abs(cloud[1, 2]) < 1e-5
+    # horizontal sweep
+    np.testing.assert_allclose(cloud[2], [0.0, 0.5, 2.0], atol=1e-6)
+
+
+def test_occupancy_grid():
+    # a wall 2m in front of the car
+    scan = make_scan([{"rx": 0.0, "ry": 0.0, "d": 2.0}])
+    grid = occupancy_grid([scan], pose=(0.0, 0.0, 0.0), size=10.0, resolution=1.0)
+    assert grid.shape == (10, 10)
+    assert grid.dtype == np.uint8
+    assert grid.sum() == 1
+    assert grid[3, 5] == 1
+
+    # the car moved 1m forward: the same point is now 1m in front of it
+    grid = occupancy_grid([scan, scan], pose=(0.0, 1.0, 0.0), size=10.0, resolution=1.0)
+    assert grid[4, 5] == 2
+
+    # the car turned right: the point is on its left
+    grid = occupancy_grid([scan], pose=(0.0, 0.0, 90.0), size=10.0, resolution=1.0)
+    assert grid[5, 3] == 1
+
+    # filtered by height
+    assert occupancy_grid([scan], pose=(0.0, 0.0, 0.0), height_range=(0.1, 1.0)).sum() == 0
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.envs.donkey_proc` module."""
+
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from gym_donkeycar.envs.donkey_ex import SimFailed
+from gym_donkeycar.envs.donkey_proc import DonkeyUnityProcess
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def proc():
+    # a running process, standing for the sim started by start()
+    proc = DonkeyUnityProcess()
+    proc.proc1 = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    yield proc
+    proc.quit()
+
+
+def test_wait_ready(proc):
+    port = free_port()
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    def listen():
+        server.bind(("127.0.0.1", port))
+        server.listen()
+
+    # the sim starts listening after a while
+    timer = threading.Timer(0.2, listen)
+    timer.start()
+    try:
+        elapsed = proc.wait_ready(5.0, host="127.0.0.1", port=port)
+        assert 0.2 <= elapsed < 2.0
+    finally:
+        timer.join()
+        server.close()
+
+
+def test_wait_ready_timeout(proc):
+    with pytest.raises(SimFailed):
+        proc.wait_ready(0.2, host="127.0.0.1", port=free_port())
+
+
+def test_wait_ready_not_started():
+    port = free_port()
+    server = socket.socket()
+    server.bind(("127.0.0.1", port))
+    server.listen()
+    try:
+        proc = DonkeyUnityProcess()
+        proc.start("remote", port=port)
+        assert proc.wait_ready(5.0, host="127.0.0.1", port=port) == 0.0
+        # no connection was made to the remote sim
+        server.settimeout(0.05)
+        with pytest.raises(socket.timeout):
+            server.accept()
+    finally:
+        server.close()
+
+
+def test_wait_ready_process_exited(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / DonkeyUnityProcess.LOG_FILE).write_text("loading\ncrashed: no GPU\n")
+    proc = DonkeyUnityProcess()
+    proc.proc1 = subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"])
+    proc.proc1.wait()
+    with pytest.raises(SimFailed, match="code 3(.|\n)*no GPU"):
+        proc.wait_ready(5.0, host="127.0.0.1", port=free_port())
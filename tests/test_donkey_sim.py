@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.envs.donkey_sim` module."""
+
+import asyncio
+import base64
+import logging
+import threading
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from gym_donkeycar.core.image import LazyFrame
+from gym_donkeycar.envs.donkey_env import supply_defaults
+from gym_donkeycar.envs.donkey_ex import SimFailed
+from gym_donkeycar.envs.donkey_sim import DonkeyUnitySimHandler
+
+
+def telemetry_message(**values):
+    jpg = BytesIO()
+    Image.new("RGB", (160, 120), (10, 20, 30)).save(jpg, format="JPEG")
+    message = {"msg_type": "telemetry", "image": base64.b64encode(jpg.getvalue()).decode(), "hit": "none", "cte": 0.5}
+    message.update(values)
+    return message
+
+
+def make_handler(**overrides):
+    conf = {"level": "donkey-generated-roads", "log_level": logging.WARNING}
+    conf.update(overrides)
+    supply_defaults(conf)
+    return DonkeyUnitySimHandler(conf)
+
+
+@pytest.fixture
+def handler(request):
+    # conf overrides: @pytest.mark.parametrize("handler", [{...}], indirect=True)
+    handler = make_handler(**getattr(request, "param", {}))
+    yield handler
+    handler.on_close()
+
+
+def test_observe_waits_for_telemetry(handler):
+    timer = threading.Timer(0.05, handler.on_recv_message, args=(telemetry_message(cte=1.5),))
+    timer.start()
+    observation, _, done, info = handler.observe(timeout=2.0)
+    timer.join()
+    assert observation.shape == (120, 160, 3)
+    assert info["cte"] == 1.5
+    assert not done
+    assert not handler.stalled
+
+
+def test_observe_timeout(handler):
+    handler.on_recv_message(telemetry_message())
+    handler.observe(timeout=1.0)
+    # no new telemetry since the last observation
+    with pytest.raises(SimFailed):
+        handler.observe(timeout=0.01)
+    assert handler.stalled
+
+
+@pytest.mark.parametrize("handler", [{"decode_threads": 2}], indirect=True)
+def test_decode_threads(handler):
+    message = telemetry_message()
+    message["image_b"] = message["image"]
+    for cte in (0.1, 0.2, 0.3):
+        handler.on_recv_message(dict(message, cte=cte))
+    observation, _, _, info = handler.observe(timeout=2.0)
+    assert info["cte"] == 0.3
+    assert observation.shape == (120, 160, 3)
+    assert tuple(observation[0, 0]) == tuple(info["image_b"][0, 0])
+    assert handler.frame is handler.latest_frame
+
+
+@pytest.mark.parametrize("handler", [{"decode_threads": 1}], indirect=True)
+def test_close_cancels_decoding(handler):
+    # keep the decoding thread busy
+    release = threading.Event()
+    handler.decode_executor.submit(release.wait, 2.0)
+    handler.on_recv_message(telemetry_message())
+    image = handler.latest_frame.image
+    handler.on_close()
+    release.set()
+    assert image.cancelled()
+
+
+@pytest.mark.parametrize("handler", [{"lidar_outputs": ("point_cloud", "occupancy_grid")}], indirect=True)
+def test_lidar_outputs(handler):
+    handler.send_lidar_config(deg_per_sweep_inc=2.0, num_sweeps_levels=1, offset_y=0.5, offset_z=0.0)
+    points = [{"rx": float(rx), "ry": 0.0, "d": 5.0} for rx in range(0, 360, 2)]
+    handler.on_recv_message(telemetry_message(lidar=points))
+    _, _, _, info = handler.observe(timeout=1.0)
+
+    assert info["lidar"].shape == (180,)
+    assert info["lidar_point_cloud"].shape == (180, 3)
+    np.testing.assert_allclose(np.linalg.norm(info["lidar_point_cloud"][:, [0, 2]], axis=1), 5.0, rtol=1e-5)
+    grid = info["lidar_occupancy_grid"]
+    assert grid.shape == (80, 80)
+    assert grid.sum() == 180
+
+    # the lidar products are the ones of the frame being observed
+    handler.on_recv_message(telemetry_message(lidar=points[:10]))
+    assert len(handler.get_lidar_point_cloud()) == 180
+    assert handler.get_lidar_occupancy_grid().sum() == 180
+    _, _, _, info = handler.observe(timeout=1.0)
+    assert len(info["lidar_point_cloud"]) == 10
+    assert info["lidar_occupancy_grid"].sum() == 190
+
+
+def test_observe_frame_snapshot(handler):
+    handler.on_recv_message(telemetry_message(cte=1.0, pos_x=1.0, pos_y=0.0, pos_z=2.0))
+    _, _, _, info = handler.observe(timeout=1.0)
+    frame = handler.frame
+    # the next telemetry does not change the values being observed
+    handler.on_recv_message(telemetry_message(cte=2.0, pos_x=3.0, pos_y=0.0, pos_z=4.0))
+    assert handler.frame is frame
+    assert (handler.cte, handler.x, handler.z) == (1.0, 1.0, 2.0)
+    assert info["pos"] == (1.0, 0.0, 2.0)
+    with pytest.raises(AttributeError):
+        frame.cte = 3.0
+
+    handler.observe(timeout=1.0)
+    assert (handler.cte, handler.x, handler.z) == (2.0, 3.0, 4.0)
+    assert handler.frame.seq == frame.seq + 1
+
+
+def test_collision_kept_until_observed(handler):
+    handler.on_recv_message(telemetry_message(hit="wall"))
+    handler.on_recv_message(telemetry_message(hit="none"))
+    _, reward, done, info = handler.observe(timeout=1.0)
+    assert info["hit"] == "wall"
+    assert done
+    assert reward == -1.0
+
+
+def test_telemetry_extra_fields(handler):
+    handler.on_recv_message(telemetry_message(cte=1.0, activeNode=3))
+    extractor = handler.telemetry_extractor
+    _, _, _, info = handler.observe(timeout=1.0)
+    assert info["activeNode"] == 3
+    assert "image" not in info
+
+    # same fields: the extractor is reused
+    handler.on_recv_message(telemetry_message(cte=2.0, activeNode=4))
+    assert handler.telemetry_extractor is extractor
+    handler.on_recv_message(telemetry_message(cte=3.0))
+    assert handler.telemetry_extractor is not extractor
+    _, _, _, info = handler.observe(timeout=1.0)
+    assert info["cte"] == 3.0
+    assert "activeNode" not in info
+
+
+class RecordingClient:
+    def __init__(self):
+        self.sent = []
+
+    def queue_message(self, msg):
+        self.sent.append(msg["msg_type"])
+
+    send_now = queue_message
+
+
+def test_send_config_only_changes(handler):
+    client = RecordingClient()
+    handler.on_connect(client)
+    conf = {"cam_config": {"img_w": 160, "img_h": 120}, "lidar_config": {"deg_per_sweep_inc": 2.0}}
+    handler.send_config(conf)
+    assert client.sent == ["cam_config", "lidar_config"]
+
+    client.sent.clear()
+    handler.send_config(conf)
+    assert client.sent == []
+    handler.send_config(dict(conf, cam_config={"img_w": 320, "img_h": 240}))
+    assert client.sent == ["cam_config"]
+
+    # the sim asks for the whole config again
+    client.sent.clear()
+    handler.conf.update(conf)
+    handler.on_recv_message({"msg_type": "need_car_config"})
+    assert client.sent == ["cam_config", "lidar_config"]
+
+
+def test_send_config_after_scene_change(handler):
+    client = RecordingClient()
+    handler.on_connect(client)
+    handler.conf.update({"cam_config": {"img_w": 160, "img_h": 120}})
+    handler.on_recv_message({"msg_type": "car_loaded"})
+    assert "cam_config" in client.sent
+
+    # the car of the new scene is a new one, with the default config
+    client.sent.clear()
+    handler.send_exit_scene()
+    handler.send_load_scene("generated_road")
+    handler.on_recv_message({"msg_type": "car_loaded"})
+    assert client.sent[:2] == ["exit_scene", "load_scene"]
+    assert "cam_config" in client.sent
+
+
+def test_handshake(handler):
+    handler.on_connect(RecordingClient())
+    handler.on_recv_message(telemetry_message())
+    # the car is not loaded yet
+    assert not handler.ready.is_set()
+
+    handler.on_recv_message({"msg_type": "car_loaded"})
+    assert handler.loaded
+    handler.on_recv_message(telemetry_message())
+    assert handler.ready.is_set()
+    assert list(handler.handshake_timings) == ["connect", "car_loaded", "config", "first_frame", "total"]
+
+
+@pytest.mark.parametrize("handler", [{"preprocess": {"resolution": (60, 80)}}], indirect=True)
+def test_handshake_checks_camera_size(handler):
+    handler.on_connect(RecordingClient())
+    handler.on_recv_message({"msg_type": "car_loaded"})
+    # an image of the preprocessed size, not of the camera size
+    small = BytesIO()
+    Image.new("RGB", (80, 60)).save(small, format="JPEG")
+    handler.on_recv_message(telemetry_message(image=base64.b64encode(small.getvalue()).decode()))
+    assert not handler.ready.is_set()
+
+    handler.on_recv_message(telemetry_message())
+    assert handler.ready.is_set()
+
+
+def test_reset_detected_from_telemetry(handler):
+    handler.reset_timeout = 0.2
+    start = telemetry_message(pos_x=1.0, pos_y=0.0, pos_z=2.0, speed=0.0)
+    # the first reset learns the start position after the timeout
+    threading.Timer(0.05, handler.on_recv_message, args=(start,)).start()
+    handler.reset()
+    assert handler.spawn_pos == (1.0, 0.0, 2.0)
+    assert handler.reset_stats.timeouts == 1
+
+    handler.reset_timeout = 2.0
+    handler.on_recv_message(telemetry_message(pos_x=30.0, pos_y=0.0, pos_z=40.0, speed=5.0, hit="wall"))
+    messages = [
+        # sent before the reset was processed by the sim
+        telemetry_message(pos_x=30.0, pos_y=0.0, pos_z=40.0, speed=0.0),
+        start,
+    ]
+    timers = [threading.Timer(0.05 * (i + 1), handler.on_recv_message, args=(m,)) for i, m in enumerate(messages)]
+    for timer in timers:
+        timer.start()
+    handler.reset()
+    assert handler.reset_stats.count == 2
+    assert handler.reset_stats.timeouts == 1
+    assert handler.reset_stats.last < 1.0
+
+    handler.on_recv_message(start)
+    _, _, done, info = handler.observe(timeout=1.0)
+    assert info["hit"] == "none"
+    assert not done
+
+
+def test_areset(handler):
+    handler.spawn_pos = (1.0, 0.0, 2.0)
+    handler.reset_timeout = 2.0
+
+    async def reset():
+        # the telemetry is received on the event loop, like with AsyncSimClient
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, handler.on_recv_message, telemetry_message(pos_x=1.0, pos_y=0.0, pos_z=2.0, speed=0.0))
+        await handler.areset()
+
+    asyncio.run(reset())
+    assert handler.reset_stats.count == 1
+    assert handler.reset_stats.timeouts == 0
+    assert handler.reset_stats.last < 1.0
+
+
+@pytest.mark.parametrize("handler", [{"preprocess": {"resolution": (60, 80), "grayscale": True}}], indirect=True)
+def test_preprocess(handler):
+    assert handler.get_sensor_size() == (60, 80, 1)
+    handler.on_recv_message(telemetry_message())
+    observation, _, _, _ = handler.observe(timeout=1.0)
+    assert observation.shape == (60, 80, 1)
+    assert observation.dtype == np.uint8
+
+
+def test_skipped_frames_not_decoded(handler):
+    handler.on_recv_message(telemetry_message())
+    first, _, _, _ = handler.observe(timeout=1.0)
+
+    handler.decode_images = False
+    handler.on_recv_message(telemetry_message(cte=1.0))
+    assert isinstance(handler.latest_frame.image, str)
+    observation, _, _, info = handler.observe(timeout=1.0, decode=False)
+    assert info["cte"] == 1.0
+    # the image of the skipped frame is not decoded
+    assert observation is first
+
+    handler.on_recv_message(telemetry_message(cte=2.0))
+    observation, _, _, _ = handler.observe(timeout=1.0)
+    assert observation is not first
+    assert observation.shape == (120, 160, 3)
+
+    # the frame ending the episode is always decoded
+    handler.on_recv_message(telemetry_message(hit="wall"))
+    last, _, done, _ = handler.observe(timeout=1.0, decode=False)
+    assert done
+    assert last is not observation
+
+
+@pytest.mark.parametrize("handler", [{"observation_mode": "lazy"}], indirect=True)
+def test_lazy_observations(handler):
+    message = telemetry_message()
+    handler.on_recv_message(message)
+    assert isinstance(handler.latest_frame.image, str)
+    observation, _, _, _ = handler.observe(timeout=1.0)
+    assert isinstance(observation, LazyFrame)
+    assert observation.data == base64.b64decode(message["image"])
+    assert observation.shape == (120, 160, 3)
+    assert np.asarray(observation).shape == (120, 160, 3)
+
+    with pytest.raises(ValueError):
+        make_handler(observation_mode="jpeg")
+
+
+@pytest.mark.parametrize("handler", [{"episode_over_every_frame": False}, {"episode_over_every_frame": True}], indirect=True)
+def test_episode_over_every_frame(handler):
+    every_frame = handler.episode_over_every_frame
+    seen = []
+
+    def episode_over(self):
+        seen.append(self.cte)
+        self.over = self.cte > self.max_cte
+
+    handler.set_episode_over_fn(episode_over)
+    for cte in (0.5, 10.0, 0.5):
+        handler.on_recv_message(telemetry_message(cte=cte))
+    # only called when observing
+    assert seen == []
+    _, _, done, info = handler.observe(timeout=1.0)
+    assert done == every_frame
+    assert seen == ([0.5, 10.0] if every_frame else [0.5])
+    assert info["cte"] == 0.5
+    assert handler.cte == 0.5
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `gym_donkeycar.envs.donkey_telemetry` module."""
+
+import math
+import pickle
+
+import pytest
+
+from gym_donkeycar.envs.donkey_sim import euler_to_quat, rotate_vec
+from gym_donkeycar.envs.donkey_telemetry import INFO_KEYS, MESSAGE_KEYS, TelemetryExtractor, TelemetryInfo, TelemetryRecord
+
+
+def make_record():
+    values = {name: float(i) for i, name in enumerate(TelemetryRecord._fields)}
+    values["hit"] = "none"
+    values["lap_count"] = 2
+    return TelemetryRecord(**values)
+
+
+def test_lazy_values():
+    record = make_record()
+    info = TelemetryInfo(record, {"extra": 1})
+    assert isinstance(info, dict)
+    assert info.lazy
+    assert info["pos"] == (record.x, record.y, record.z)
+    assert info.get("gyro") == (record.gyro_x, record.gyro_y, record.gyro_z)
+    assert info.get("unknown", 42) == 42
+    assert "cte" in info and "extra" in info and "unknown" not in info
+    # only the values read were computed
+    assert dict.__len__(info) == 3
+    assert info.lazy
+
+    assert list(info) == list(INFO_KEYS) + ["extra"]
+    assert not info.lazy
+    assert len(info) == len(INFO_KEYS) + 1
+
+
+def test_dict_compatible():
+    info = TelemetryInfo(make_record())
+    expected = dict(info)
+    assert expected["lap_count"] == 2
+    assert info == expected
+    assert TelemetryInfo(make_record()) == expected
+    assert {**TelemetryInfo(make_record())} == expected
+
+    info = TelemetryInfo(make_record())
+    info["episode"] = {"r": 1.0}
+    info["cte"] = -1.0
+    del info["lidar"]
+    assert info["cte"] == -1.0
+    assert "lidar" not in info
+    assert info["episode"] == {"r": 1.0}
+
+    restored = pickle.loads(pickle.dumps(info))
+    assert type(restored) is dict
+    assert restored == info
+
+
+def test_extractor():
+    message = {"msg_type": "telemetry", "image": "", "steering_angle": 0.1, "activeNode": 3}
+    message.update({key: float(i) for i, key in enumerate(MESSAGE_KEYS)})
+    message["hit"] = "none"
+    extractor = TelemetryExtractor(message)
+    assert extractor.complete
+    assert extractor.matches(message)
+    assert not extractor.matches(dict(message, lidar=[]))
+    values = extractor.values(message, TelemetryRecord.empty())
+    assert values == tuple(message[key] for key in MESSAGE_KEYS)
+    assert extractor.extras(message) == {"steering_angle": 0.1, "activeNode": 3}
+
+    # values missing from the message are taken from the previous frame
+    del message["cte"], message["steering_angle"], message["activeNode"]
+    extractor = TelemetryExtractor(message)
+    assert not extractor.complete
+    prev = make_record()
+    record = TelemetryRecord._make(extractor.values(message, prev) + prev[len(MESSAGE_KEYS) :])
+    assert record.cte == prev.cte
+    assert record.x == message["pos_x"]
+    assert extractor.extras(message) is None
+
+
+@pytest.mark.parametrize("angles", [(0.0, 0.0, 0.0), (0.0, 90.0, 0.0), (10.0, 45.0, -5.0), (-30.0, 200.0, 15.0)])
+def test_forward_vel(angles):
+    pitch, yaw, roll = angles
+    vel = (1.0, -2.0, 3.0)
+    record = TelemetryRecord.empty()._replace(pitch=pitch, yaw=yaw, roll=roll, vel_x=vel[0], vel_y=vel[1], vel_z=vel[2])
+    forward = rotate_vec(euler_to_quat([math.radians(pitch), math.radians(yaw), math.radians(roll)]), [0.0, 0.0, 1.0])
+    assert record.forward_vel == pytest.approx(sum(f * v for f, v in zip(forward, vel)))
+    assert TelemetryInfo(record)["forward_vel"] == record.forward_vel
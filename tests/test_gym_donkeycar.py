@@ -31,3 +31,18 @@ def test_load_gyms(mocker):
         assert env.spec.id == gym_name
         assert sim_ctl.call_count == i + 1
         assert unity_proc.call_count == i + 1
+
+
+def test_frame_skip(mocker):
+    mocker.patch("gym_donkeycar.envs.donkey_env.DonkeyUnitySimContoller")
+    mocker.patch("gym_donkeycar.envs.donkey_env.DonkeyUnityProcess")
+    conf = {"exe_path": "remote", "host": "127.0.0.1", "port": 9091, "frame_skip": 3}
+    env = gym.make(env_list[0], conf=conf).unwrapped
+    env.viewer.observe.side_effect = [("obs", 1.0, False, {}), ("obs", 1.0, True, {}), ("obs", 1.0, False, {})]
+    _, reward, terminated, _, _ = env.step([0.0, 0.5])
+    # the episode ended on the second frame
+    assert env.viewer.take_action.call_count == 2
+    assert reward == 2.0
+    assert terminated
+    assert [call[1]["decode"] for call in env.viewer.observe.call_args_list] == [False, False]
+    env.viewer.set_decode_images.assert_called_with(True)